@@ -1,49 +1,475 @@
-import threading, pickle
-from lib.udp import ClientUDP, ErrorUDP
+import threading, struct, json, math, time
+from collections import deque
+from lib.udp import ClientUDP, ErrorUDP, Spec as SpecUDP
 from lib.console import Console
-from game.bulletsystem import BulletSystem, Bullet
+from game.bulletsystem import BulletSystem
 from data.spec import Spec
 import numpy as np
 from lib.perfeval import Counter
 
-class GameData:
-    def __init__(self, player):
+# wire format: version, type of message, length of the payload,
+# session token (given by the server), sequence number
+WIRE_VERSION = 2
+HEADER = struct.Struct('<BBHII')
+
+MSG_STATE = 0
+MSG_LOCKSTEP = 1
+
+def pack_message(msg_type: int, seq: int, payload: bytes, token=0) -> bytes:
+    '''
+    Return the message: header + payload.
+    '''
+    return HEADER.pack(WIRE_VERSION, msg_type, len(payload), token, seq) + payload
+
+def unpack_message(msg: bytes):
+    '''
+    Return the type, the sequence number and the payload of the message
+    (the token is the one of the sender, forwarded by the relay: ignored).  
+    Raise a ValueError if the message is invalid.
+    '''
+    if len(msg) < HEADER.size:
+        raise ValueError("Message too short.")
+
+    version, msg_type, length, _, seq = HEADER.unpack_from(msg)
+
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unknown version: {version}.")
+
+    if len(msg) < HEADER.size + length:
+        raise ValueError("Truncated message.")
+
+    return msg_type, seq, memoryview(msg)[HEADER.size:HEADER.size + length]
+
+def quantize(values, scale):
+    '''
+    Return the values multiplied by the scale, as int16.
+    '''
+    values = np.round(scale * np.asarray(values))
+    return np.clip(values, -2**15, 2**15 - 1).astype('int16')
+
+class GameState:
+    '''
+    State of a player, as sent to the opponent.  
+    The values are quantized (see `Spec.SNAPSHOT_...` scales).
+    '''
+    # quantized states of the blocks, indexed by grid coordinate
+    cell_fields = {'hps': '<i2', 'shield_hps': '<i2', 'actives': bool, 'turrets': '<u2'}
+
+    def __init__(self):
+
+        self.pos = np.zeros(2, dtype='<i2')
+        self.speed = np.zeros(2, dtype='<i2')
+        self.acc = np.zeros(2, dtype='<i2')
+        self.orien = 0
+
+        for name, dtype in self.cell_fields.items():
+            setattr(self, name, np.zeros(Spec.SHAPE_GRID_SHIP, dtype=dtype))
 
+        self.actions = []
+
+    @classmethod
+    def from_player(cls, player):
+        '''
+        Create the state of the given player.
+        '''
+        state = cls()
         ship = player.ship
+
         # basic info
-        self.pos = np.array(ship.get_pos(), dtype='int16')
-        self.speed = np.array(ship.get_speed(), dtype='float32')
-        self.acc = np.array(ship.get_acc(), dtype='float32')
-        self.orien = ship.orien
+        state.pos[:] = ship.get_pos()
+        state.speed[:] = quantize(ship.get_speed(), Spec.SNAPSHOT_SPEED_SCALE)
+        state.acc[:] = quantize(ship.get_acc(), Spec.SNAPSHOT_ACC_SCALE)
+        state.orien = int(round(Spec.SNAPSHOT_ANGLE_SCALE * ship.orien))
 
         # blocks
-        self.hps = np.zeros(Spec.SHAPE_GRID_SHIP, dtype='int16')
-        self.shield_hps = np.zeros(Spec.SHAPE_GRID_SHIP, dtype='int16')
-        self.actives = np.zeros(Spec.SHAPE_GRID_SHIP, dtype=bool)
-
-        for block in ship.blocks.values():
-            x,y = block.coord
-            self.hps[x,y] = block.hp
-            self.shield_hps[x,y] = block.hp_shield
-            self.actives[x,y] = block.get_activate()
-
-        # bullets
-        bullets = BulletSystem.get_bullets_by_team(player.team)
-        self.bullets = np.zeros((len(bullets),5), dtype='int32')
-        for i, bullet in enumerate(bullets):
-            x, y = bullet.get_pos()
-            self.bullets[i,:] = bullet.id, x, y, 1e4 * bullet.orien, bullet.damage
-
-        # turrets
-        turrets = ship.typed_blocks['Turret']
-        self.turrets = np.zeros((len(turrets)), dtype='float32')
-        for i, turret in enumerate(turrets):
-            self.turrets[i] = turret.orien
+        state.hps[:] = ship.states.hp
+        state.shield_hps[:] = np.round(ship.states.hp_shield)
+        state.actives[:] = ship.states.active
+
+        for turret in ship.typed_blocks['Turret']:
+            x, y = turret.coord
+            state.turrets[x,y] = round(turret.orien) % 360
+
+        # actions cache, the first ones fitting in SNAPSHOT_MAX_ACTIONS_SIZE
+        state.actions = []
+        size = 2
 
-        # actions cache
-        self.actions = []
         for action in player.get_cache(string_format=True):
-            self.actions.append(action)
+            size += len(json.dumps(action)) + 1
+
+            if size > Spec.SNAPSHOT_MAX_ACTIONS_SIZE:
+                break
+
+            state.actions.append(action)
+
+        return state
+
+    def get_changed_cells(self, state):
+        '''
+        Return the (flat) indexes of the cells that are different
+        from the given state.
+        '''
+        changed = np.zeros(Spec.SHAPE_GRID_SHIP, dtype=bool)
+
+        for name in self.cell_fields:
+            changed |= getattr(self, name) != getattr(state, name)
+
+        return np.flatnonzero(changed).astype('uint8')
+
+class GameData:
+    '''
+    Snapshot of a player, sent to the opponent.  
+    Only contains the differences with a previous state (the base)
+    that the opponent has received (see `GameClient.send_state`).  
+    Sent in a binary format (see `to_bytes`, `from_bytes`).
+    '''
+    # base_seq, ack, pos, speed, acc, orien,
+    # number of changed cells, of new bullets, of removed bullets, length of actions
+    _struct = struct.Struct('<ii6hiBHHi')
+
+    def __init__(self, state: GameState, base: GameState, seq: int, base_seq, ack,
+            spawns, despawns):
+
+        self.seq = seq
+        self.base_seq = base_seq # None: difference with an empty state
+        self.ack = ack # last snapshot received from the opponent
+
+        self.pos = state.pos
+        self.speed = state.speed
+        self.acc = state.acc
+        self.orien = state.orien
+
+        # changed cells
+        self.cells = state.get_changed_cells(base)
+        self.values = [getattr(state, name).flat[self.cells] for name in GameState.cell_fields]
+
+        # bullets' events not yet acknowledged
+        # spawns: id, x, y, orien, damage, age (number of steps since the spawn)
+        self.new_bullets = spawns
+        # despawns: ids
+        self.removed_bullets = despawns
+
+        # actions cache, None if unchanged
+        if state.actions == base.actions:
+            self.actions = None
+        else:
+            self.actions = state.actions
+
+    def get_state(self, base: GameState) -> GameState:
+        '''
+        Return the state of the opponent,
+        given the base state of the snapshot.
+        '''
+        state = GameState()
+
+        state.pos = self.pos
+        state.speed = self.speed
+        state.acc = self.acc
+        state.orien = self.orien
+
+        for name, values in zip(GameState.cell_fields, self.values):
+            array = getattr(base, name).copy()
+            array.flat[self.cells] = values
+            setattr(state, name, array)
+
+        # the bullets are handled separately (see `GameClient.on_message`)
+
+        if self.actions is None:
+            state.actions = base.actions
+        else:
+            state.actions = self.actions
+
+        return state
+
+    def to_bytes(self, token=0) -> bytes:
+        '''
+        Return the message of the snapshot, given the session token.  
+        A `None` base_seq, ack or actions is encoded as -1.
+        '''
+        if self.actions is None:
+            actions = b''
+            len_actions = -1
+        else:
+            actions = json.dumps(self.actions).encode()
+            len_actions = len(actions)
+
+        payload = [
+            self._struct.pack(
+                -1 if self.base_seq is None else self.base_seq,
+                -1 if self.ack is None else self.ack,
+                *self.pos, *self.speed, *self.acc, self.orien,
+                len(self.cells), len(self.new_bullets), len(self.removed_bullets),
+                len_actions,
+            ),
+            self.cells.tobytes(),
+        ]
+
+        for values, dtype in zip(self.values, GameState.cell_fields.values()):
+            payload.append(values.astype(dtype).tobytes())
+
+        payload.append(self.new_bullets.astype('<i4').tobytes())
+        payload.append(self.removed_bullets.astype('<i4').tobytes())
+        payload.append(actions)
+
+        return pack_message(MSG_STATE, self.seq, b''.join(payload), token=token)
+
+    @classmethod
+    def from_bytes(cls, seq: int, payload):
+        '''
+        Return the snapshot given its sequence number and payload (see `to_bytes`).  
+        Raise a ValueError if the payload is invalid.
+        '''
+        data = cls.__new__(cls)
+        data.seq = seq
+
+        try:
+            fields = cls._struct.unpack_from(payload)
+        except struct.error:
+            raise ValueError("Payload too short.")
+        
+        base_seq, ack = fields[:2]
+        data.base_seq = None if base_seq == -1 else base_seq
+        data.ack = None if ack == -1 else ack
+
+        data.pos = np.array(fields[2:4], dtype='<i2')
+        data.speed = np.array(fields[4:6], dtype='<i2')
+        data.acc = np.array(fields[6:8], dtype='<i2')
+        data.orien = fields[8]
+
+        n_cells, n_new, n_removed, len_actions = fields[9:]
+        offset = cls._struct.size
+
+        # copy the values: the payload can be a view of the receive buffer
+        def read(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(payload, dtype=dtype, count=count, offset=offset).copy()
+            offset += array.nbytes
+            return array
+
+        data.cells = read('u1', n_cells)
+        data.values = [read(dtype, n_cells) for dtype in GameState.cell_fields.values()]
+
+        if np.any(data.cells >= Spec.SHAPE_GRID_SHIP[0] * Spec.SHAPE_GRID_SHIP[1]):
+            raise ValueError("Invalid cell.")
+
+        data.new_bullets = read('<i4', 6*n_new).reshape((n_new, 6))
+        data.removed_bullets = read('<i4', n_removed)
+
+        if len_actions == -1:
+            data.actions = None
+        else:
+            actions = bytes(payload[offset:offset+len_actions])
+
+            if len(actions) != len_actions:
+                raise ValueError("Payload too short.")
+            
+            actions = json.loads(actions)
+
+            if type(actions) != list:
+                raise ValueError("Invalid actions.")
+
+            data.actions = [str(action) for action in actions]
+
+        return data
+
+class LockstepData:
+    '''
+    Message of the lockstep mode:  
+    the inputs (orders of the script) of the frames not yet acknowledged by the opponent,
+    the last contiguous frame of the opponent's inputs received
+    and the last state hash.  
+    Sent in a binary format (see `to_bytes`, `from_bytes`),
+    only the known orders can be decoded.
+    '''
+    # ack, frame & value of the hash (frame: -1 if no hash), number of frames
+    _struct = struct.Struct('<iiIB')
+    # frame, number of orders
+    _frame_struct = struct.Struct('<iH')
+    # block's key, index of the function, delay, number of args & kwargs
+    _action_struct = struct.Struct('<HBiBB')
+    _byte_struct = struct.Struct('<B')
+
+    order_types = ('rotate', 'engine', 'action')
+    # functions of the blocks that can be given in an order
+    action_funcs = ('set_activate', 'set_intensity', 'add_prtc_block', 'remove_prtc_block', 'rotate')
+    action_kwargs = ('at_runtime',)
+
+    # type of the values: bool, int, float, block's key ('block', key)
+    _value_structs = (struct.Struct('<?'), struct.Struct('<q'), struct.Struct('<d'), struct.Struct('<H'))
+
+    def __init__(self, inputs, ack, state_hash):
+        self.inputs = inputs # key: frame, value: list of orders
+        self.ack = ack
+        self.hash = state_hash # (frame, hash) or None
+
+    @classmethod
+    def pack_value(cls, value) -> bytes:
+        '''
+        Return the bytes of a value of an order.
+        '''
+        if type(value) == bool:
+            kind = 0
+        elif type(value) == int:
+            kind = 1
+        elif type(value) == float:
+            kind = 2
+        elif type(value) == tuple and len(value) == 2 and value[0] == 'block':
+            kind = 3
+            value = value[1]
+        else:
+            raise ValueError(f"Invalid value: {value}.")
+
+        return bytes([kind]) + cls._value_structs[kind].pack(value)
+
+    @classmethod
+    def pack_frame(cls, frame: int, orders: list) -> bytes:
+        '''
+        Return the bytes of the orders of a frame.
+        '''
+        payload = [cls._frame_struct.pack(frame, len(orders))]
+
+        for order in orders:
+            payload.append(bytes([cls.order_types.index(order[0])]))
+
+            if order[0] == 'rotate':
+                payload.append(cls.pack_value(order[1]))
+
+            elif order[0] == 'engine':
+                payload.append(cls._value_structs[3].pack(order[1]))
+                payload.append(cls.pack_value(order[2]))
+
+            else:
+                key, func, args, kwargs, delay, desc = order[1:]
+                desc = str(desc).encode()[:255]
+
+                payload.append(cls._action_struct.pack(
+                    key, cls.action_funcs.index(func), delay, len(args), len(kwargs)))
+                
+                for arg in args:
+                    payload.append(cls.pack_value(arg))
+                
+                for name, value in kwargs.items():
+                    payload.append(bytes([cls.action_kwargs.index(name)]))
+                    payload.append(cls.pack_value(value))
+                
+                payload.append(bytes([len(desc)]) + desc)
+        
+        return b''.join(payload)
+
+    def to_bytes(self, token=0, max_size=None) -> bytes:
+        '''
+        Return the message, given the session token.  
+        Only the first frames that fit in `max_size` bytes are sent
+        (at least one).
+        '''
+        if self.hash is None:
+            hash_frame, hash_value = -1, 0
+        else:
+            hash_frame, hash_value = self.hash
+
+        frames = []
+        size = self._struct.size
+
+        for frame, orders in self.inputs.items():
+            data = self.pack_frame(frame, orders)
+            size += len(data)
+
+            if len(frames) == 255 or (len(frames) > 0 and not max_size is None and size > max_size):
+                break
+            
+            frames.append(data)
+
+        payload = self._struct.pack(self.ack, hash_frame, hash_value, len(frames))
+        # the frames are given in the payload
+        return pack_message(MSG_LOCKSTEP, 0, payload + b''.join(frames), token=token)
+
+    @classmethod
+    def from_bytes(cls, payload):
+        '''
+        Return the message given its payload (see `to_bytes`).  
+        Raise a ValueError if the payload is invalid.
+        '''
+        offset = 0
+
+        def read(_struct):
+            nonlocal offset
+            try:
+                values = _struct.unpack_from(payload, offset)
+            except struct.error:
+                raise ValueError("Payload too short.")
+            offset += _struct.size
+            return values
+
+        def read_value():
+            kind, = read(cls._byte_struct)
+
+            if kind >= len(cls._value_structs):
+                raise ValueError(f"Invalid value type: {kind}.")
+            
+            value, = read(cls._value_structs[kind])
+
+            if kind == 2 and not math.isfinite(value):
+                raise ValueError("Invalid value.")
+
+            if kind == 3:
+                return ('block', value)
+            return value
+
+        def read_index(names):
+            index, = read(cls._byte_struct)
+
+            if index >= len(names):
+                raise ValueError(f"Invalid index: {index}.")
+            return names[index]
+
+        ack, hash_frame, hash_value, n_frames = read(cls._struct)
+
+        if hash_frame == -1:
+            state_hash = None
+        else:
+            state_hash = (hash_frame, hash_value)
+
+        inputs = {}
+
+        for _ in range(n_frames):
+            frame, n_orders = read(cls._frame_struct)
+
+            if frame < -1:
+                raise ValueError(f"Invalid frame: {frame}.")
+            
+            orders = []
+
+            for _ in range(n_orders):
+                order_type = read_index(cls.order_types)
+
+                if order_type == 'rotate':
+                    orders.append(('rotate', read_value()))
+                    
+                elif order_type == 'engine':
+                    key, = read(cls._value_structs[3])
+                    orders.append(('engine', key, read_value()))
+
+                else:
+                    key, func, delay, n_args, n_kwargs = read(cls._action_struct)
+
+                    if func >= len(cls.action_funcs):
+                        raise ValueError(f"Invalid function: {func}.")
+
+                    args = tuple(read_value() for _ in range(n_args))
+                    kwargs = {read_index(cls.action_kwargs): read_value() for _ in range(n_kwargs)}
+
+                    length, = read(cls._byte_struct)
+                    desc = bytes(payload[offset:offset+length]).decode(errors='replace')
+                    offset += length
+
+                    orders.append(('action', key, cls.action_funcs[func], args, kwargs, delay, desc))
+
+                if offset > len(payload):
+                    raise ValueError("Payload too short.")
+
+            inputs[frame] = orders
+        
+        return cls(inputs, ack, state_hash)
 
 class GameClient(ClientUDP):
 
@@ -51,6 +477,9 @@ class GameClient(ClientUDP):
 
         super().__init__(addr)
 
+        # session token, identify the client on the server
+        self.token = 0
+
         self.reset_values()
 
     def start(self):
@@ -66,7 +495,20 @@ class GameClient(ClientUDP):
         '''
         Reset all values stored in client.
         '''
-        self.data = None
+        # last received state of the opponent: (seq, state),
+        # replaced as a whole by the network thread -> never partially updated
+        self.latest = None
+        self._applied_state = None
+
+        # own snapshots, key: seq
+        self.seq = 0
+        self._sent_states = {}
+        # last own snapshot received by the opponent
+        self.ack = None
+
+        # opponent's states, key: seq
+        self._received_states = {}
+        self.remote_seq = None
         self.opponent_state = {
             'pos': None,
             'orien': None,
@@ -80,8 +522,32 @@ class GameClient(ClientUDP):
 
         self.opp_team = None
 
-        # contains opponent bullets (temporary)
-        self.bullets = []
+        # own bullets' events not yet acknowledged by the opponent (oldest first),
+        # key: id, value: (seq of the event, seq of the first sending (None: not sent),
+        # spawn: id, x, y, orien, damage)
+        self._spawns = {}
+        # key: id, value: seq of the first sending (None: not sent)
+        self._despawns = {}
+
+        # opponent's bullets received but not yet given to the BulletSystem
+        # (deque: thread safe append/popleft)
+        self._new_bullets = deque()
+        self._removed_bullets = deque()
+        self._last_bullet_id = -1
+
+        # lockstep mode
+        self.own_inputs = {} # not yet acknowledged inputs, key: frame
+        self.remote_inputs = {} # key: frame
+        self.remote_frame = -2 # last contiguous frame received (setup frame is -1)
+        self.remote_hashes = {} # key: frame
+        self.own_hash = None
+        self._last_flush = 0
+
+    def set_token(self, token):
+        '''
+        Set the session token of the game (given by the server).
+        '''
+        self.token = token
 
     def set_opp_team(self, team):
         '''
@@ -90,56 +556,281 @@ class GameClient(ClientUDP):
         '''
         self.opp_team = team
 
-    def on_message(self, data):
-        self.data = pickle.loads(data)
-        self.update_bullets()    
+    def on_message(self, msg):
+        try:
+            msg_type, seq, payload = unpack_message(msg)
+
+            if msg_type == MSG_STATE:
+                # drop the old & reordered snapshots
+                if not self.remote_seq is None and seq <= self.remote_seq:
+                    return
+
+                data = GameData.from_bytes(seq, payload)
+            elif msg_type == MSG_LOCKSTEP:
+                data = LockstepData.from_bytes(payload)
+            else:
+                raise ValueError(f"Unknown message type: {msg_type}.")
 
-    def update_bullets(self):
-        for infos in self.data.bullets:
-            _id, x, y, orien, damage = infos
-            bullet = Bullet(self.opp_team, [x, y], 1e-4 * orien, damage=damage, _id=_id)
-            self.bullets.append(bullet)
+        except ValueError as e:
+            ErrorUDP.call(f"Invalid message: {e}", warning=True)
+            return
+
+        if isinstance(data, LockstepData):
+            self._on_lockstep_data(data)
+            return
+
+        self._on_game_data(data)
+
+    def _on_game_data(self, data):
+        '''
+        Reconstruct the opponent's state from the received snapshot,
+        store the new & removed bullets.
+        '''
+        if data.base_seq is None:
+            base = GameState()
+        elif data.base_seq in self._received_states:
+            base = self._received_states[data.base_seq]
+        else:
+            # base state forgotten -> wait for the next snapshot
+            return
+        
+        if not data.ack is None and (self.ack is None or data.ack > self.ack):
+            self.ack = data.ack
+
+        state = data.get_state(base)
+        self._received_states[data.seq] = state
+
+        for seq in list(self._received_states.keys()):
+            if seq <= data.seq - Spec.SNAPSHOT_HISTORY:
+                self._received_states.pop(seq)
+
+        self.remote_seq = data.seq
+        self.latest = (data.seq, state)
+        
+        # the same events are received until they are acknowledged,
+        # the ids are increasing -> only keep the unknown bullets
+        bullets = data.new_bullets[data.new_bullets[:,0] > self._last_bullet_id]
+
+        if len(bullets) > 0:
+            self._new_bullets.append(bullets)
+            self._last_bullet_id = bullets[:,0].max()
+
+        if len(data.removed_bullets) > 0:
+            self._removed_bullets.append(data.removed_bullets)
+
+    def get_opp_bullets(self):
+        '''
+        Return the opponent's bullets received since the last call:
+        the new bullets (id, x, y, orien, damage, age) and the ids of the removed bullets.
+        '''
+        new_bullets = []
+        removed_bullets = []
+
+        while len(self._new_bullets) > 0:
+            new_bullets.append(self._new_bullets.popleft())
+
+        while len(self._removed_bullets) > 0:
+            removed_bullets.append(self._removed_bullets.popleft())
+        
+        if len(new_bullets) > 0:
+            new_bullets = np.concatenate(new_bullets)
+        else:
+            new_bullets = np.zeros((0,6), dtype='int32')
+
+        if len(removed_bullets) > 0:
+            removed_bullets = np.concatenate(removed_bullets)
+        else:
+            removed_bullets = np.zeros(0, dtype='int32')
+
+        return new_bullets, removed_bullets
+
+    def _on_lockstep_data(self, data):
+        '''
+        Store the received inputs & hash,
+        forget the own inputs acknowledged by the opponent.
+        '''
+        for frame, inputs in data.inputs.items():
+            if frame > self.remote_frame:
+                self.remote_inputs[frame] = inputs
+        
+        while self.remote_frame + 1 in self.remote_inputs:
+            self.remote_frame += 1
+
+        for frame in list(self.own_inputs.keys()):
+            if frame <= data.ack:
+                self.own_inputs.pop(frame, None)
+
+        if not data.hash is None:
+            frame, value = data.hash
+            self.remote_hashes[frame] = value
+
+    def send_inputs(self, frame, inputs, state_hash=None):
+        '''
+        Lockstep mode.  
+        Add the inputs of a frame to the ones to send,
+        set the last state hash: (frame, hash).
+        '''
+        self.own_inputs[frame] = inputs
+
+        if not state_hash is None:
+            self.own_hash = state_hash
+
+    @Counter.add_func
+    def flush_inputs(self):
+        '''
+        Lockstep mode.  
+        Send the inputs not yet acknowledged by the opponent
+        (the oldest ones, at most `Spec.LOCKSTEP_MAX_FRAMES`),
+        should be called once a frame, even when the game is waiting
+        for the opponent's inputs (lost messages are sent again).  
+        Send at most one message per simulation step.
+        '''
+        now = time.perf_counter()
+
+        if now - self._last_flush < 1 / Spec.TICK_RATE:
+            return
+        
+        self._last_flush = now
+
+        # the opponent only executes contiguous frames -> send the oldest ones first,
+        # copy: the acknowledged inputs are removed by the network thread
+        inputs = sorted(self.own_inputs.copy().items())[:Spec.LOCKSTEP_MAX_FRAMES]
+        inputs = dict(inputs)
+
+        data = LockstepData(inputs, self.remote_frame, self.own_hash)
+        self.send(data.to_bytes(self.token, max_size=SpecUDP.BUFSIZE - HEADER.size))
+
+    def _get_bullets_events(self):
+        '''
+        Register the new events of the own bullets,
+        forget the ones acknowledged by the opponent
+        and the spawns of the bullets that don't exist anymore.  
+        Return the spawns (id, x, y, orien, damage, age) and despawns (ids) to send:
+        the oldest ones, at most `Spec.SNAPSHOT_MAX_SPAWNS/DESPAWNS`.  
+        An event sent once is then sent in each snapshot until acknowledged.
+        '''
+        spawns, despawns = BulletSystem.pop_events()
+
+        for spawn in spawns:
+            self._spawns[int(spawn[0])] = (self.seq, None, spawn)
+        
+        for _id in despawns:
+            self._despawns[int(_id)] = None
+
+        if not self.ack is None:
+            for _id, (_, sent_seq, _) in list(self._spawns.items()):
+                if not sent_seq is None and sent_seq <= self.ack:
+                    self._spawns.pop(_id)
+
+            for _id, sent_seq in list(self._despawns.items()):
+                if not sent_seq is None and sent_seq <= self.ack:
+                    self._despawns.pop(_id)
+
+        # the bullets that left the arena (or hit a ship) don't need to be spawned
+        if len(self._spawns) > 0:
+            team = BulletSystem.own_player.team
+            alive = set(BulletSystem.ids[BulletSystem.get_bullets_by_team(team)].tolist())
+
+            for _id in list(self._spawns.keys()):
+                if not _id in alive:
+                    self._spawns.pop(_id)
+
+        n_spawns = min(len(self._spawns), Spec.SNAPSHOT_MAX_SPAWNS)
+        spawns = np.zeros((n_spawns, 6), dtype='<i4')
+
+        for i, _id in zip(range(n_spawns), list(self._spawns.keys())):
+            seq, sent_seq, spawn = self._spawns[_id]
+
+            if sent_seq is None:
+                self._spawns[_id] = (seq, self.seq, spawn)
+
+            spawns[i,:5] = spawn
+            spawns[i,5] = self.seq - seq
+
+        n_despawns = min(len(self._despawns), Spec.SNAPSHOT_MAX_DESPAWNS)
+        despawns = np.zeros(n_despawns, dtype='<i4')
+
+        for i, _id in zip(range(n_despawns), list(self._despawns.keys())):
+            if self._despawns[_id] is None:
+                self._despawns[_id] = self.seq
+
+            despawns[i] = _id
+
+        return spawns, despawns
 
     @Counter.add_func
     def send_state(self, player):
         '''
-        Send the state of the player to the opponent.
+        Send the state of the player to the opponent,
+        as the differences with the last state received by the opponent.
         '''
-        data = GameData(player)
-        self.send(pickle.dumps(data))
+        state = GameState.from_player(player)
+        self.seq += 1
+
+        if self.ack in self._sent_states:
+            base_seq = self.ack
+            base = self._sent_states[base_seq]
+        else:
+            base_seq = None
+            base = GameState()
+
+        spawns, despawns = self._get_bullets_events()
+
+        data = GameData(state, base, self.seq, base_seq, self.remote_seq, spawns, despawns)
+        self._sent_states[self.seq] = state
+
+        # forget the states that won't be used as base anymore
+        for seq in list(self._sent_states.keys()):
+            if (not base_seq is None and seq < base_seq) or seq <= self.seq - Spec.SNAPSHOT_HISTORY:
+                self._sent_states.pop(seq)
+
+        self.send(data.to_bytes(self.token))
 
     @Counter.add_func
     def set_opp_state(self, player):
-        if self.data is None:
+        '''
+        Set the last received state of the opponent,
+        only update the blocks that changed since the last applied state.
+        '''
+        latest = self.latest
+
+        if latest is None or latest[1] is self._applied_state:
             return
         
+        state = latest[1]
+        
+        previous = self._applied_state
+        if previous is None:
+            previous = GameState()
+        
+        self._applied_state = state
         ship = player.ship
 
-        ship.set_pos(self.data.pos)
-        ship.orien = self.data.orien
-        ship.speed[:] = self.data.speed
-        ship.acc[:] = self.data.acc
+        ship.set_pos(state.pos)
+        ship.orien = state.orien / Spec.SNAPSHOT_ANGLE_SCALE
+        ship.speed[:] = state.speed / Spec.SNAPSHOT_SPEED_SCALE
+        ship.acc[:] = state.acc / Spec.SNAPSHOT_ACC_SCALE
 
-        # get it as a list -> remove value during iteration
-        items = list(ship.blocks.items())
+        for idx in state.get_changed_cells(previous):
+            x, y = np.unravel_index(idx, Spec.SHAPE_GRID_SHIP)
+            key = int(ship.blocks_grid[x,y])
 
-        for key, block in items:
-            x, y = block.coord
+            if key == 0:
+                continue
 
-            if self.data.hps[x,y] <= 0:
+            if state.hps[x,y] <= 0:
                 ship.remove_block(key)
                 continue
 
-            block.hp = self.data.hps[x,y]
-            block.hp_shield = self.data.shield_hps[x,y]
-            block.set_activate(self.data.actives[x,y])
+            block = ship.blocks[key]
+            block.hp = state.hps[x,y]
+            block.hp_shield = state.shield_hps[x,y]
 
-        # set turrets' orien
-        oriens = self.data.turrets
+            if block.active != state.actives[x,y]:
+                block.set_activate(bool(state.actives[x,y]))
 
-        for turret, orien in zip(ship.typed_blocks['Turret'], oriens):
-            turret.orien = orien
-            turret.rotate_surf(orien)
+            if block.name == 'Turret' and state.turrets[x,y] != previous.turrets[x,y]:
+                block.rotate_surf(int(state.turrets[x,y]))
 
         # actions cache
-        player.str_cache = self.data.actions
\ No newline at end of file
+        player.str_cache = state.actions
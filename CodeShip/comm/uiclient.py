@@ -1,5 +1,5 @@
 import threading, pickle, time
-from lib.tcp import ClientTCP, Message, ErrorTCP
+from lib.tcp import ClientTCP, Message, ErrorTCP, pack_script, unpack_script, get_script_hash, get_grid_hash
 from lib.console import Console
 from data.spec import Spec
 import numpy as np
@@ -11,7 +11,15 @@ class UIClient(ClientTCP):
         super().__init__(addr, connect=connect)
         self.username = None
 
-        self._script_cache = []
+        # last script exchanged with the server: hash, script
+        self._script_hash = None
+        self._script = None
+        # hash of the script stored on the server
+        self._server_script_hash = None
+
+        # requested opponent's grid: hash, time of the request
+        self._opp_grid_hash = None
+        self._opp_grid_time = None
 
         # store the identifiers of the comm as key
         # the values are the msg send by the server
@@ -26,12 +34,13 @@ class UIClient(ClientTCP):
             'gc'  :   [], # message on general chat
             'pc'  :   [], # message on private chat
             'rpd' : None, # response to profil demand
+            'rlb' : None, # response to leaderboard demand: rank, number of users, top & around entries
             'sh'  : None, # ship array
             'shst': None, # ship status
             'sc'  : None, # script
             'scst': None, # script status (if it's ready or not)
             'rsca': None, # result of script analyse
-            'ign' : None, # notify as in game, contains opp's username, team
+            'ign' : None, # notify as in game, contains opp's username, team, udp session token, game's seed, opp's grid hash
             'igsh': None, # opponent's ship grid
             'gis' : None, # opponent info after initalisation
             'ige' : None, # opponent's number of errors in script
@@ -64,14 +73,20 @@ class UIClient(ClientTCP):
             ErrorTCP.call("Unpickling failed.")
             return
 
-        # look for script line
-        if msg.identifier == 'scl':
-            self._script_cache.append(msg.content)
-            return
+        if msg.identifier == 'sc':
+            msg.content = self._receive_script(msg.content)
+
+            if msg.content is None:
+                return
+        
+        elif msg.identifier == 'ign':
+            self._look_opp_grid(msg.content[4])
+        
+        elif msg.identifier == 'igsh':
+            msg.content = self._receive_opp_grid(msg.content)
 
-        elif msg.identifier == 'sc':
-            msg.content = '\n'.join(self._script_cache)
-            self._script_cache = []
+            if msg.content is None:
+                return
 
         container = self.in_data[msg.identifier]
 
@@ -82,6 +97,35 @@ class UIClient(ClientTCP):
         
         self.display_msg(msg)
 
+    def is_game_ready(self):
+        '''
+        Return if every data needed to start the game has been received
+        (notification & opponent's grid).
+        '''
+        return not self.in_data['ign'] is None and not self.in_data['igsh'] is None
+
+    def is_game_setup_expired(self):
+        '''
+        Return if the opponent's grid hasn't been received
+        `Spec.GAME_SETUP_TIMEOUT` seconds after the notification.
+        '''
+        if self.in_data['ign'] is None or not self.in_data['igsh'] is None:
+            return False
+
+        return time.time() - self._opp_grid_time > Spec.GAME_SETUP_TIMEOUT
+
+    def abort_game_setup(self):
+        '''
+        Abort the game being set up (counted as a loss).
+        '''
+        ErrorTCP.call("Opponent's ship grid not received, game aborted.")
+
+        self.in_data['ign'] = None
+        # ignore the grid if it comes later
+        self._opp_grid_hash = None
+
+        self.send_end_game(False)
+
     def get_data(self, identifier):
         '''
         To use as a context manager.  
@@ -101,7 +145,7 @@ class UIClient(ClientTCP):
             content = ''
         
         # player stats
-        elif msg.identifier == 'rpd':
+        elif msg.identifier in ('rpd', 'rlb'):
             content = msg.content['username']
 
         else:
@@ -109,12 +153,79 @@ class UIClient(ClientTCP):
 
         Console.print('[TCP] {' + msg.identifier + '} ' + content)
 
-    def _send_script(self, script: str):
+    def _receive_script(self, content):
+        '''
+        Return the script of a script message,
+        if omitted: the last exchanged script (None if it doesn't match).
+        '''
+        try:
+            script_hash, script = unpack_script(content)
+        except Exception:
+            ErrorTCP.call("Invalid script received.")
+            return None
+
+        if script is None:
+
+            if script_hash != self._script_hash:
+                ErrorTCP.call("Unknown script hash.", warning=True)
+                return None
+            
+            script = self._script
+        
+        self._script_hash = script_hash
+        self._script = script
+        self._server_script_hash = script_hash
+
+        return script
+
+    def _look_opp_grid(self, grid_hash: str):
+        '''
+        Look for the opponent's grid in the cache,
+        if not there: ask it to the server.
         '''
-        Send the script by little chunk to the client
+        grid = None
+        self._opp_grid_hash = grid_hash
+        self._opp_grid_time = time.time()
+
+        # the hash is used as filename
+        if grid_hash.isalnum():
+            grid = Spec.load_cached_grid(grid_hash)
+
+        if grid is None:
+            self.send(Message('igsh', grid_hash), pickling=True)
+        else:
+            self.in_data['igsh'] = grid
+
+    def _receive_opp_grid(self, content):
         '''
-        for line in script.split('\n'):
-            self.send(Message('scl', line), pickling=True)
+        Return the opponent's grid of the message, store it in the cache.  
+        If it isn't the requested grid or doesn't match its hash,
+        it is still used but not cached.  
+        Return None if the grid is invalid or wasn't requested.
+        '''
+        grid_hash, grid = content
+
+        if self._opp_grid_hash is None:
+            return None
+
+        try:
+            grid = np.array(grid, dtype=int)
+        except (ValueError, TypeError):
+            grid = None
+
+        if grid is None or grid.shape != tuple(Spec.SHAPE_GRID_SHIP):
+            ErrorTCP.call("Invalid ship grid received.")
+            return None
+
+        if grid_hash != self._opp_grid_hash:
+            ErrorTCP.call("Received ship grid isn't the requested one.", warning=True)
+
+        if get_grid_hash(grid) != grid_hash or not grid_hash.isalnum():
+            ErrorTCP.call("Ship grid doesn't match its hash.", warning=True)
+            return grid
+        
+        Spec.store_cached_grid(grid_hash, grid)
+        return grid
 
     def connect_udp(self, port):
         '''
@@ -131,10 +242,19 @@ class UIClient(ClientTCP):
 
     def send_login(self, username, password):
         '''
-        Send the login information to the server.  
-        ID : lg
+        Send the login information to the server,
+        with the hash of the script stored on local (not sent again by the server).  
+        ID : sch/lg
         '''
-        self.send(Message('lg', [username, password]), pickling=True)
+        msgs = [Message('lg', [username, password])]
+        data = Spec.load_user_data(username)
+
+        if not data is None:
+            self._script = '\n'.join(data['script'])
+            self._script_hash = get_script_hash(self._script)
+            msgs.insert(0, Message('sch', self._script_hash))
+
+        self.send_many(msgs, pickling=True)
     
     def send_sign_up(self, username, password):
         '''
@@ -203,8 +323,16 @@ class UIClient(ClientTCP):
         else:
             identifier = 'sc'
 
-        self._send_script(script)
-        self.send(Message(identifier, None), pickling=True)
+        # the script is omitted if it is the one stored on the server
+        content = pack_script(script, known_hash=self._server_script_hash)
+
+        self._script_hash = content[0]
+        self._script = script
+
+        if not analysis:
+            self._server_script_hash = content[0]
+
+        self.send(Message(identifier, content), pickling=True)
 
     def send_script_status(self, status):
         '''
@@ -229,10 +357,19 @@ class UIClient(ClientTCP):
 
     def send_profil_demand(self, username):
         '''
-        Send a demand for the server to send info about the user
-        ID: pd
+        Send a demand for the server to send info about the user,
+        and its rank in the leaderboard.
+        ID: pd/lb
+        '''
+        self.send_many([Message('pd', username), Message('lb', [username, 0])], pickling=True)
+
+    def send_leaderboard_demand(self, username, n_users=0):
+        '''
+        Send a demand for the server to send the rank of the user,
+        the `n_users` first users and the `n_users` users around the user.
+        ID: lb
         '''
-        self.send(Message('pd', username), pickling=True)
+        self.send(Message('lb', [username, n_users]), pickling=True)
 
     def send_game_init_info(self, max_shield_hp):
         '''
@@ -268,6 +405,7 @@ class ContextManager:
             'gc'  :   [],
             'pc'  :   [],
             'rpd' : None,
+            'rlb' : None,
             'sh'  : None,
             'shst': None,
             'sc'  : None,
@@ -41,6 +41,36 @@ class Spec:
 
     SCRIPT_EXEC_TIME = 0.005
 
+    # simulation steps per second (independent of the rendering)
+    TICK_RATE = 30
+    # maximum number of simulation steps per rendered frame
+    MAX_TICKS_PER_FRAME = 5
+    # maximum rendering frame rate during a game (interpolated display)
+    GAME_FPS = 120
+    # maximum time waiting for the opponent's grid before aborting the game (sec)
+    GAME_SETUP_TIMEOUT = 10
+
+    # snapshots: scales of the quantized values
+    SNAPSHOT_SPEED_SCALE = 100
+    SNAPSHOT_ACC_SCALE = 1000
+    SNAPSHOT_ANGLE_SCALE = 1e4
+    # number of snapshots kept to compute/apply the differences
+    SNAPSHOT_HISTORY = 64
+    # maximum number of bullets' spawns/despawns & size of the actions (bytes)
+    # in a snapshot -> keep it under the receive buffer size
+    SNAPSHOT_MAX_SPAWNS = 100
+    SNAPSHOT_MAX_DESPAWNS = 200
+    SNAPSHOT_MAX_ACTIONS_SIZE = 512
+
+    # lockstep mode: only the orders of the scripts are sent (see game.lockstep)
+    LOCKSTEP = False
+    # number of frames before the execution of the own inputs
+    LOCKSTEP_DELAY = 3
+    # number of frames between two state hashes
+    LOCKSTEP_HASH_INTERVAL = 30
+    # maximum number of frames of inputs in a message (keep it under BUFSIZE)
+    LOCKSTEP_MAX_FRAMES = 16
+
     SIZE_GRID_SHIP = 6
     SHAPE_GRID_SHIP = np.array([6,6])
     DIM_SHIP = np.array([600,600])
@@ -81,6 +111,10 @@ class Spec:
     DIM_MAX_EXPL = np.array([60,60])
     DIM_MIN_EXPL = np.array([20,20])
     TIME_EXPL = 3
+    # maximum number of explosions displayed at once
+    MAX_EXPL = 64
+    # number of pre-rendered explosion images
+    N_FRAMES_EXPL = 16
 
     COLOR_P1 = C.BLUE
     COLOR_P2 = C.PURPLE
@@ -179,6 +213,33 @@ class Spec:
         if os.path.exists(filename):
             os.remove(filename)
 
+    @classmethod
+    def load_cached_grid(cls, grid_hash):
+        '''
+        Load & return a ship grid of the cache (given its hash),
+        None if it isn't stored.
+        '''
+        filename = os.path.join('data','accounts','grids',f'{grid_hash}.json')
+
+        if not os.path.exists(filename):
+            return None
+
+        with open(filename, 'r') as file:
+            grid = json.load(file)
+        
+        return np.array(grid, dtype=int)
+
+    @classmethod
+    def store_cached_grid(cls, grid_hash, grid):
+        '''
+        Store a ship grid in the cache (given its hash).
+        '''
+        dirname = os.path.join('data','accounts','grids')
+        os.makedirs(dirname, exist_ok=True)
+
+        with open(os.path.join(dirname, f'{grid_hash}.json'), 'w') as file:
+            json.dump(np.asarray(grid).tolist(), file)
+
     @classmethod
     def store_local_profil(cls, username, client):
         '''
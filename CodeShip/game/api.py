@@ -25,12 +25,31 @@ class API:
     _ship_cls = None
     _opponent_cls = None
 
+    # lockstep: list of the recorded orders of the script (None: not recording)
+    _inputs = None
+    # lockstep: if True, the recorded orders are executed later (see game.lockstep)
+    _defer_inputs = False
+
     @classmethod
     def reset(cls):
         ''' Reset API '''
         cls._state = 0
         cls._players = {'own':None, 'opp':None}
         cls._ships = {'own':None, 'opp':None}
+        cls._inputs = None
+        cls._defer_inputs = False
+
+    @classmethod
+    def _record_input(cls, order: tuple) -> bool:
+        '''
+        Record an order given by the script (lockstep mode).  
+        Return if the order must not be executed now.
+        '''
+        if cls._inputs is None:
+            return False
+        
+        cls._inputs.append(order)
+        return cls._defer_inputs
 
     @classmethod
     def set_players(cls, own_player: Player, opp_player: Player):
@@ -150,6 +169,19 @@ class Block:
         given the function, the args and kwargs,
         The desc is what is displayed on the interface.
         '''
+        order = ('action', self.key, func.__name__, args, kwargs, delay, desc)
+
+        if self._api._record_input(order):
+            return
+
+        self._queue_action(func, *args, delay=delay, desc=desc, **kwargs)
+
+    def _queue_action(self, func, *args, delay=0, desc=None, **kwargs):
+        '''
+        Internal method.  
+        Add an action to the actions list (see `_add_action`),
+        without recording it.
+        '''
         action = WeakDict(
             func = func,
             delay = delay,
@@ -464,6 +496,9 @@ class Engine(Block):
         if self.team == 'opp': 
             raise ValueError("Try to give order to opponent ship.")
         
+        if self._api._record_input(('engine', self.key, value)):
+            return
+
         self._api._ships[self.team].blocks[self.key].activation_per = value
 
 map_block = {
@@ -706,6 +741,9 @@ class Ship:
             # given angle is already target angle
             return
         
+        if cls._api._record_input(('rotate', angle)):
+            return
+
         cls._target_angle = angle
         cls._inversed = False
 
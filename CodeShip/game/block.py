@@ -1,8 +1,8 @@
 import pygame, os
 import numpy as np
 from lib.plougame import Form, C
-from lib.plougame.helper import Delayer
-from game.bulletsystem import Bullet, BulletSystem
+from lib.plougame.helper import Delayer, mean, get_dark_color, get_light_color
+from game.bulletsystem import BulletSystem
 from game.geometry import get_deg, get_rad, get_polar, get_cartesian, get_norm
 from data.spec import Spec
 
@@ -23,6 +23,194 @@ img_turret = pygame.image.load(os.path.join(folder ,'turret.png')).convert_alpha
 img_turret = pygame.transform.rotate(img_turret, 270)
 img_turret = pygame.transform.scale(img_turret, Spec.DIM_TURRET)
 
+class TurretSprites:
+    '''
+    Static object.  
+    Bank of compiled turret block surfaces (block's color, rotated turret, marges),
+    one for each whole degree and each block color.  
+    The surfaces are built when first needed,
+    the rotated turrets are shared by all the colors.
+    '''
+    sprites = {} # key: color, value: list of surfaces (index: angle, None: not built)
+    _turrets = [None] * 360 # rotated turrets (index: angle, None: not built)
+
+    @classmethod
+    def _get_turret(cls, angle: int) -> pygame.Surface:
+        '''
+        Return the turret image rotated of the given angle (deg).
+        '''
+        if cls._turrets[angle] is None:
+            cls._turrets[angle] = pygame.transform.rotate(img_turret, angle)
+        
+        return cls._turrets[angle]
+
+    @classmethod
+    def build(cls, color, angle: int) -> pygame.Surface:
+        '''
+        Create the surface of the given color & angle (deg).
+        '''
+        # same as the color of the block's marges
+        if mean(color) < 60:
+            marge_color = get_light_color(color)
+        else:
+            marge_color = get_dark_color(color)
+
+        width = Spec.DIM_BLOCK_MARGE
+        x, y = Spec.DIM_BLOCK
+
+        img = cls._get_turret(angle)
+        dim_img = np.array(img.get_size(), dtype='int32')
+        
+        surface = pygame.Surface(Spec.DIM_BLOCK)
+        surface.fill(color)
+        surface.blit(img, (Spec.DIM_BLOCK - dim_img) // 2)
+
+        pygame.draw.line(surface, marge_color, (0,0), (x,0), width)
+        pygame.draw.line(surface, marge_color, (0,0), (0,y), width)
+        pygame.draw.line(surface, marge_color, (x,0), (x,y), width)
+        pygame.draw.line(surface, marge_color, (0,y), (x,y), width)
+
+        return surface
+
+    @classmethod
+    def get(cls, color, angle: float) -> pygame.Surface:
+        '''
+        Return the turret block surface of the given color,
+        rotated of the given angle (deg, rounded).
+        '''
+        color = tuple(color)
+        angle = round(angle) % 360
+
+        if not color in cls.sprites:
+            cls.sprites[color] = [None] * 360
+        
+        surfaces = cls.sprites[color]
+
+        if surfaces[angle] is None:
+            surfaces[angle] = cls.build(color, angle)
+
+        return surfaces[angle]
+
+class BlockStates:
+    '''
+    Table of the states of the blocks of a ship.  
+    Each state is an array of the shape of the ship's grid,
+    indexed by the coordinate of the blocks,
+    the `Block` objects read & write their own cell.  
+    Cells without block are set to zero.  
+    The power level is kept up to date as the states are set (see `set_state`).
+    '''
+    # name: dtype
+    fields = {
+        'hp': 'int32',
+        'hp_shield': float,
+        'max_hp_shield': float,
+        'frozen_hp_shield': float, # hp stored when the shield goes inactivate
+        'shield_owner': 'int8', # index (+1) of the protecting shield, 0 if none
+        'active': bool,
+        'power_output': float,
+        'activation': float, # engine: % of activation, shield: intensity, other: 1
+        'is_engine': bool,
+    }
+
+    # states that define the power output of a block
+    power_fields = ('active', 'power_output', 'activation', 'is_engine')
+
+    def __init__(self):
+        for name, dtype in self.fields.items():
+            setattr(self, name, np.zeros(Spec.SHAPE_GRID_SHIP, dtype=dtype))
+
+        # sum of the power outputs of the blocks
+        self.power_level = 0
+
+    def set_state(self, name, cell, value):
+        '''
+        Set the state of one cell,
+        update the power level if the state defines the power output.
+        '''
+        if name in self.power_fields:
+            self.power_level -= self.get_power_output(cell)
+            getattr(self, name)[cell] = value
+            self.power_level += self.get_power_output(cell)
+        else:
+            getattr(self, name)[cell] = value
+
+    def copy_cell(self, states, cell):
+        '''
+        Copy the states of one cell from an other table.
+        '''
+        for name in self.fields:
+            self.set_state(name, cell, getattr(states, name)[cell])
+
+    def clear_cell(self, cell):
+        '''
+        Set all the states of one cell to zero.
+        '''
+        for name in self.fields:
+            self.set_state(name, cell, 0)
+
+    def get_power_output(self, cell) -> float:
+        '''
+        Return the power output of one cell,
+        the engines' outputs only depend on their activation.
+        '''
+        if self.is_engine[cell] or self.active[cell]:
+            return float(self.power_output[cell] * self.activation[cell])
+        else:
+            return 0
+
+    def get_power_level(self) -> float:
+        '''
+        Return the sum of the power outputs of the blocks.
+        '''
+        # remove the accumulated floating point errors
+        return round(self.power_level, 6)
+
+    def get_engines_activation(self) -> float:
+        '''
+        Return the sum of the activations of the engines.
+        '''
+        return float(np.sum(self.activation[self.is_engine]))
+
+    def regenerate_shields(self):
+        '''
+        Regenerate the shield hp of the protected blocks,  
+        each shield splits its regeneration rate between its damaged blocks.
+        '''
+        protected = self.shield_owner > 0
+
+        if not np.any(protected):
+            return
+
+        owners = self.shield_owner[protected]
+        damaged = self.hp_shield[protected] < self.max_hp_shield[protected]
+
+        n_damaged = np.bincount(owners[damaged], minlength=Spec.SIZE_GRID_SHIP**2 + 1)
+        n_damaged = n_damaged[owners]
+
+        regen = np.divide(Spec.SHIELD_REGEN_RATE, n_damaged, 
+                    out=np.zeros(len(owners)), where=n_damaged > 0)
+
+        hp_shield = np.minimum(self.hp_shield[protected] + regen, self.max_hp_shield[protected])
+        # don't cap the blocks of shields without damaged blocks
+        self.hp_shield[protected] = np.where(n_damaged > 0, hp_shield, self.hp_shield[protected])
+
+class _State:
+    '''
+    Attribute of a block stored in its cell of the states table.
+    '''
+    def __init__(self, field, cast):
+        self.field = field
+        self.cast = cast
+
+    def __get__(self, block, owner):
+        if block is None:
+            return self
+        return self.cast(getattr(block._states, self.field)[block._cell])
+
+    def __set__(self, block, value):
+        block._states.set_state(self.field, block._cell, value)
+
 class Block(Form):
 
     name = 'Block'
@@ -35,8 +223,20 @@ class Block(Form):
     
     signal_shield = Form(Spec.DIM_SIGNAL, (0,0), color=Spec.COLOR_SIGNAL_SHIELD)
 
+    # states stored in the states table
+    hp = _State('hp', int)
+    hp_shield = _State('hp_shield', float)
+    max_hp_shield = _State('max_hp_shield', float)
+    frozen_hp_shield = _State('frozen_hp_shield', float)
+    active = _State('active', bool)
+    power_output = _State('power_output', float)
+
     def __init__(self, coord, color=None, image=None, hp=None):
 
+        # own states table, until the block is attached to a ship (see `set_states`)
+        self._states = BlockStates()
+        self._cell = tuple(int(i) for i in coord)
+
         if hp == None:
             self.hp = Spec.HP_BLOCK
         else:
@@ -44,6 +244,8 @@ class Block(Form):
         
         self.active = True
         self.power_output = 0
+        self._states.set_state('activation', self._cell, 1)
+        self._states.set_state('is_engine', self._cell, self.name == 'Engine')
         
         # shield
         self.hp_shield = 0
@@ -76,6 +278,14 @@ class Block(Form):
 
         self.set_marge_width(Spec.DIM_BLOCK_MARGE, scale=True)
 
+    def set_states(self, states: BlockStates):
+        '''
+        Move the states of the block in the given states table
+        (the table of the ship).
+        '''
+        states.copy_cell(self._states, self._cell)
+        self._states = states
+
     def hit(self, damage):
         '''
         Hit the block, with a damage amound,  
@@ -231,11 +441,14 @@ class Engine(Block):
 
     name = 'Engine'
 
+    # % of activation
+    activation_per = _State('activation', float)
+
     def __init__(self, coord, color=None):
         super().__init__(coord, color=color)
 
         self.power_output = -Spec.POWER_CONS_MOTOR
-        self.activation_per = 1 # % of activation
+        self.activation_per = 1
 
         # blit the engine image on the surface -> can resize the image
         self.get_surface('original').blit(img_engine, (Spec.DIM_BLOCK-Spec.DIM_ITEM)//2)
@@ -285,48 +498,44 @@ class Shield(Block):
         self.blocks = []
         self.intensity = None
 
+        # index of the shield in the states table's shield_owner
+        self._owner_id = self._cell[0] * Spec.SIZE_GRID_SHIP + self._cell[1] + 1
+
         # blit the shield image on the surface -> can resize the image
         self.get_surface('original').blit(img_shield, (Spec.DIM_BLOCK-Spec.DIM_ITEM)//2)
         self.set_surface(self.get_surface('original'))
 
+    @property
+    def intensity(self):
+        return self._intensity
+
+    @intensity.setter
+    def intensity(self, value):
+        self._intensity = value
+        # the power output is multiplied by the intensity
+        self._states.set_state('activation', self._cell, 0 if value is None else value)
+
     def is_block(self, block) -> bool:
         '''
         Return if the given block is protected by the shield.
         '''
-        for info in self.blocks:
-            if info['block'] is block:
+        for prtc_block in self.blocks:
+            if prtc_block is block:
                 return True
             
         return False
 
-    def update_state(self):
-        '''
-        Regenerate shield of protected blocks.
-        '''
-        n_damaged = 0
-
-        for info in self.blocks:
-            if info['block'].hp_shield < info['max hp']:
-                n_damaged += 1
-        
-        if n_damaged == 0:
-            return
-
-        regen_hp = Spec.SHIELD_REGEN_RATE / n_damaged
-
-        for info in self.blocks:
-            info['block'].hp_shield += regen_hp
-            if info['block'].hp_shield > info['max hp']:
-               info['block'].hp_shield = info['max hp']
-
     def balance(self, hp_shield_bonus=0):
         '''
         Balance the shield distribution amongs the protected blocks.  
         if hp_shield_bonus is set, it will be added in addition to the current hps.
         '''
+        if self.n_prtc_block == 0:
+            return
+
         current_shield = hp_shield_bonus
-        for info in self.blocks:
-            current_shield += info['block'].hp_shield
+        for block in self.blocks:
+            current_shield += block.hp_shield
         
         # can happen when decreasing intensity
         if current_shield < 0:
@@ -335,10 +544,10 @@ class Shield(Block):
         balanced_shield = current_shield / self.n_prtc_block
         balanced_max_shield = Spec.SHIELD_HP * self.intensity / self.n_prtc_block
 
-        for info in self.blocks:
-            info['block'].hp_shield = balanced_shield
-            info['max hp'] = balanced_max_shield
-            info['frozen hp'] = balanced_shield
+        for block in self.blocks:
+            block.hp_shield = balanced_shield
+            block.max_hp_shield = balanced_max_shield
+            block.frozen_hp_shield = balanced_shield
 
     def set_intensity(self, value: int, at_runtime=False):
         '''
@@ -372,16 +581,17 @@ class Shield(Block):
         # set number of shield hp per block
         hp = Spec.SHIELD_HP * self.intensity / self.n_prtc_block
 
-        for i in range(len(self.blocks)):
-            
-            # set shield hp on block
-            self.blocks[i].hp_shield = hp
+        for block in self.blocks:
+            block.hp_shield = hp
+            block.max_hp_shield = hp
+            block.frozen_hp_shield = hp
+            self._set_owner(block, True)
 
-            self.blocks[i] = {
-                'block': self.blocks[i],
-                'max hp': hp,
-                'frozen hp': hp, # hp stored when shield goes inactivate
-            }
+    def _set_owner(self, block: Block, value: bool):
+        '''
+        Set (or unset) the shield as the owner of the block in the states table.
+        '''
+        block._states.set_state('shield_owner', block._cell, self._owner_id if value else 0)
 
     def add_prtc_block(self, block: Block, at_runtime=False):
         '''
@@ -393,7 +603,7 @@ class Shield(Block):
         if self.n_prtc_block >= Spec.SHIELD_MAX_PRTC:
             return
         
-        if block in self.blocks:
+        if self.is_block(block):
             return
 
         # can only have one shield by block
@@ -402,16 +612,13 @@ class Shield(Block):
 
         block.has_shield = True
         self.n_prtc_block += 1
+        self.blocks.append(block)
         
         if at_runtime:
-            self.blocks.append({
-                'block': block,
-                'max hp': 0,
-                'frozen hp': 0,
-            })
+            block.max_hp_shield = 0
+            block.frozen_hp_shield = 0
+            self._set_owner(block, True)
             self.balance()
-        else:
-            self.blocks.append(block)
 
         # inform that the block was added
         return True
@@ -423,26 +630,25 @@ class Shield(Block):
         If at_runtime is True, will update the shields hp of every blocks
         to balance the distributed hps.
         '''
-        if not block in self.blocks:
+        if not self.is_block(block):
             return
         
         block.has_shield = False
         self.n_prtc_block -= 1
+        self.blocks.remove(block)
         
         if at_runtime:
-            idx = None
-            
-            for i, info in enumerate(self.blocks):
-                if info['block'] is block:
-                    idx = i
-
-            if idx == None:
-                raise IndexError(f"Given block is not protected: {block}")
-
-            self.blocks.pop(i)
+            block.hp_shield = 0
+            self._set_owner(block, False)
             self.balance()
-        else:
-            self.blocks.remove(block)            
+
+    def on_prtc_block_death(self, block: Block):
+        '''
+        Forget one of the protected block, removed at runtime,  
+        the shield hp of the other blocks are unchanged.
+        '''
+        if self.is_block(block):
+            self.blocks.remove(block)
 
     def get_power_output(self):
         if self.active:
@@ -458,13 +664,13 @@ class Shield(Block):
             return
 
         if value == False:
-            for info in self.blocks:
-                info['frozen hp'] = info['block'].hp_shield
-                info['block'].hp_shield = 0
+            for block in self.blocks:
+                block.frozen_hp_shield = block.hp_shield
+                block.hp_shield = 0
             
         else:
-            for info in self.blocks:
-                info['block'].hp_shield = info['frozen hp']
+            for block in self.blocks:
+                block.hp_shield = block.frozen_hp_shield
 
         super().set_activate(value)
 
@@ -472,8 +678,9 @@ class Shield(Block):
         '''
         Remove shield from protected blocks
         '''
-        for info in self.blocks:
-            info['block'].hp_shield = 0
+        for block in self.blocks:
+            block.hp_shield = 0
+            self._set_owner(block, False)
 
     def set_color(self, color, update_original=False):
         '''
@@ -497,7 +704,10 @@ class Turret(Block):
         self.fire_delay = 0 # timer
         
         # color that is displayed
-        self.current_color = color
+        self.current_color = self.color
+
+        # (color, angle) of the surface displayed on the ship
+        self._sprite_key = None
 
         # in deg -> makes calculations easier
         self.target_angle = 0 # deg
@@ -545,27 +755,32 @@ class Turret(Block):
 
     def rotate_surf(self, angle: float):
         '''
-        Rotate the turret surface of a given angle (deg)
+        Rotate the turret surface of a given angle (deg),  
+        update the ship's surface if the displayed turret has changed.
         '''
         self.orien = angle
 
-        # rotate the turret image, then blit on the surf
-        img = pygame.transform.rotate(img_turret, angle)
-        dim_img = np.array(img.get_size(), dtype='int32')
-        pos = (Spec.DIM_BLOCK - dim_img) // 2
-
-        # update surface - use a new one -> original already has an img blited on
-        surface = pygame.Surface(Spec.DIM_BLOCK)
-        surface.fill(self.current_color)
-
-        surface.blit(img, pos)
-        self.set_surface(surface)
+        if self._sprite_key == (tuple(self.current_color), round(angle) % 360):
+            return
 
         # update ship's surface
         self.ship.update_block(self)
         self.ship.update_signal(self)
         self.ship.update_signal(self, shield=True)
 
+    def compile(self, *, scaled=False, with_marge=True, with_font=True, extend_dim=False):
+        '''
+        Return the surface of the turret block (see `Form.compile`),  
+        the unscaled surface is taken from `TurretSprites`.
+        '''
+        if scaled or extend_dim or not with_marge:
+            return super().compile(scaled=scaled, with_marge=with_marge, 
+                            with_font=with_font, extend_dim=extend_dim)
+        
+        self._sprite_key = (tuple(self.current_color), round(self.orien) % 360)
+
+        return TurretSprites.get(self.current_color, self.orien)
+
     def rotate(self, angle: float):
         '''
         In game method.  
@@ -616,17 +831,6 @@ class Turret(Block):
         
         return self.ship.pos + pos_on_ship
 
-    def create_bullet(self): 
-        '''
-        Return a Bullet object
-        '''
-        pos = self.compute_bullet_pos()
-        
-        # compute bullet orientation
-        orien = -self.ship.orien + get_rad(self.orien)
-
-        return Bullet(self.ship.team, pos, orien)
-
     def fire(self):
         '''
         If possible, fire a bullet -> add it in the bulletsystem.
@@ -638,14 +842,18 @@ class Turret(Block):
             # reset timer
             self.fire_delay = 0
 
-            BulletSystem.add_bullet(self.create_bullet())
+            pos = self.compute_bullet_pos()
+        
+            # compute bullet orientation
+            orien = -self.ship.orien + get_rad(self.orien)
+
+            BulletSystem.add_bullet(self.ship.team, pos, orien)
 
     def set_color(self, color, update_original=False):
         '''
         Set the color of the block, set a call to update color 
         '''
         super().set_color(color, update_original=update_original)
-        self.current_color = color
-
-        # call rotate surf to change the color
-        self.rotate_surf(self.orien)
\ No newline at end of file
+        
+        # the ship's surface is updated in Ship.run_blocks
+        self.current_color = color
\ No newline at end of file
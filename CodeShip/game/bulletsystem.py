@@ -1,6 +1,6 @@
 import pygame
 import numpy as np
-from lib.plougame import Interface, Form, Dimension, C
+from lib.plougame import Interface, Dimension, C
 from game.geometry import get_deg, get_rad, get_norm
 from data.spec import Spec
 from lib.perfeval import Counter
@@ -15,200 +15,228 @@ img_bullet = pygame.transform.scale(img_bullet, Spec.DIM_BULLET)
 img_expl = pygame.image.load(folder + 'explosion.png').convert_alpha()
 img_expl = pygame.transform.scale(img_expl, Spec.DIM_MAX_EXPL)
 
-class Bullet(Form):
+class BulletSystem:
     '''
-    Bullet object.  
+    Static object.  
+    Manage bullets, explosions.    
+    Update position, display, collisions...
 
-    Args:
-        - pos : the initial position of the bullet (center)
-        - orien : the orientation of the bullet (rad)
+    The bullets are stored as arrays (one row per bullet),
+    the alive bullets are always the first `n_bullets` rows.  
+    The explosions are stored the same way, they are displayed
+    using pre-rendered images, with the bullets in one `blits` call.
     '''
+    game_client = None
+    own_player = None
+    opp_player = None
 
-    def __init__(self, team, pos, orien, speed=None, damage=None, _id=None):
-
-        super().__init__(Spec.DIM_BULLET, pos, surface=img_bullet, center=True)
-
-        self.team = team
-
-        # each bullet has a (~)unique id
-        if _id == None:
-            self.id = np.random.randint(0, 1000)
-        else:
-            self.id = _id
-
-        # rotate the bullet according to its orientation
-        self.rotate(get_deg(orien))
-
-        self.orien = orien
-        self.mask = self.get_mask()
-
-        if speed == None:
-            self.speed = Spec.SPEED_BULLET
-        else:
-            self.speed = speed
-        
-        if damage == None:
-            self.damage = Spec.DAMAGE_BULLET
-        else:
-            self.damage = damage
+    # initial number of bullets that can be stored (grows if needed)
+    CAPACITY = 256
+
+    n_bullets = 0
+    positions = np.zeros((CAPACITY, 2), dtype=float) # center, unscaled
+    velocities = np.zeros((CAPACITY, 2), dtype=float)
+    oriens = np.zeros(CAPACITY, dtype=float) # rad
+    speeds = np.zeros(CAPACITY, dtype=float)
+    damages = np.zeros(CAPACITY, dtype='int32')
+    teams = np.zeros(CAPACITY, dtype='int8')
+    ids = np.zeros(CAPACITY, dtype='int32')
+
+    # bullets that recently hit a ship -> can't hit twice (received from opponent)
+    recent_ids = np.zeros(0, dtype='int32')
+    recent_teams = np.zeros(0, dtype='int8')
+    recent_lifetimes = np.zeros(0, dtype='int32')
+
+    # each bullet of a team has a unique id
+    _next_id = 0
+
+    # events of the own bullets, sent to the opponent (see `pop_events`),
+    # only recorded when `is_replicated` is True
+    is_replicated = False
+    _spawn_events = [] # id, x, y, orien, damage
+    _despawn_events = [] # id
+
+    # explosions: at most `Spec.MAX_EXPL`, the oldest are the first rows
+    n_expl = 0
+    expl_positions = np.zeros((Spec.MAX_EXPL, 2), dtype=float) # center, unscaled
+    expl_lifetimes = np.zeros(Spec.MAX_EXPL, dtype='int32')
+    expl_frames = np.zeros(Spec.MAX_EXPL, dtype='int32') # index in `_expl_frames`
+
+    # random generator of the visual effects -> don't change the state of the game's one
+    _rng = np.random.default_rng()
+
+    # rotated bullet images, key: angle (deg)
+    _sprites = {}
+    # explosion images (scaled), the first one is the initial frame
+    _expl_frames = []
+    _sprites_factor = None
 
-    def update_state(self):
+    @classmethod
+    def set_players(cls, own_player, opp_player, is_replicated=False):
         '''
-        Update the position of the bullet.
+        Set a reference of both players, use for the collisions.  
+        If `is_replicated`, record the events of the own bullets
+        (the opponent's bullets are given by `update_opp_bullets`).
         '''
-        pos = self.get_pos(scaled=True)
-
-        x = np.cos(-self.orien) * self.speed + pos[0]
-        y = np.sin(-self.orien) * self.speed + pos[1]
-
-        self.set_pos((x,y))
+        cls.own_player = own_player
+        cls.opp_player = opp_player
+        cls.is_replicated = is_replicated
 
-class Explosion(Form):
-    '''
-    Visual effect of an explosion
-    '''
+    @classmethod
+    def reset(cls):
+        '''
+        Reset the bulletsystem.
+        '''
+        cls.n_bullets = 0
+        cls.recent_ids = np.zeros(0, dtype='int32')
+        cls.recent_teams = np.zeros(0, dtype='int8')
+        cls.recent_lifetimes = np.zeros(0, dtype='int32')
+        cls._next_id = 0
+        cls.is_replicated = False
+        cls._spawn_events = []
+        cls._despawn_events = []
+        cls.n_expl = 0
+        cls.own_player = None
+        cls.opp_player = None
 
-    def __init__(self, pos):
+    @classmethod
+    def _reserve(cls, n):
+        '''
+        Make sure that `n` more bullets can be stored,
+        if not, double the capacity of the arrays.
+        '''
+        capacity = len(cls.ids)
+        size = cls.n_bullets + n
 
-        # start with an intermediate dimension
-        dim = (Spec.DIM_MAX_EXPL + Spec.DIM_MIN_EXPL)//2
+        if size <= capacity:
+            return
 
-        super().__init__(dim, pos, surface=img_expl, center=True, scale_pos=False)
+        while capacity < size:
+            capacity *= 2
 
-        self.lifetime = Spec.TIME_EXPL
-        self.to_delete = False
+        for name in ('positions', 'velocities', 'oriens', 'speeds', 'damages', 'teams', 'ids'):
+            old = getattr(cls, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:cls.n_bullets] = old[:cls.n_bullets]
+            setattr(cls, name, new)
 
     @classmethod
-    def setup_states(cls):
+    def add_bullet(cls, team, pos, orien, speed=None, damage=None):
         '''
-        Set up states used to update explosions.  
-        state format: `{dim, image}`
+        Add a bullet to be managed by the bullet system.  
+        `pos`: the initial position of the bullet (center, unscaled)  
+        `orien`: the orientation of the bullet (rad)  
+        Return the id of the bullet.
         '''
-        cls.states = []
+        if speed is None:
+            speed = Spec.SPEED_BULLET
+        
+        if damage is None:
+            damage = Spec.DAMAGE_BULLET
 
-        for i in range(3):
-            # set dimension
-            low = Spec.DIM_MIN_EXPL[0]
-            high = Spec.DIM_MAX_EXPL[0]
-            dim = np.random.randint(low, high, size=2)
+        _id = cls._next_id
+        cls._next_id += 1
 
-            # apply rotation
-            angle = np.random.randint(360)
-            img = pygame.transform.rotate(img_expl, angle)
+        cls.add_bullets(team, [pos], [orien], [damage], [_id], speed=speed)
 
-            cls.states.append({'dim':dim, 'image':img})
+        if cls.is_replicated and team == cls.own_player.team:
+            cls._spawn_events.append((_id, pos[0], pos[1], 1e4 * orien, damage))
 
-    def update_state(self):
+        return _id
+
+    @classmethod
+    def add_bullets(cls, team, positions, oriens, damages, ids, speed=None, ages=None):
         '''
-        Rotate and rescale explosions.  
-        Update lifetime
+        Add several bullets of the same team at once,  
+        given arrays of positions (center, unscaled), orientations (rad), damages and ids.  
+        `ages`: the number of steps since the bullets have been fired at the given positions.
         '''
-        self.lifetime -= 1
-        if self.lifetime == 0:
-            self.to_delete = True
+        if speed is None:
+            speed = Spec.SPEED_BULLET
+
+        n = len(ids)
+        if n == 0:
             return
 
-        state = np.random.choice(self.states)
+        cls._reserve(n)
+        s = slice(cls.n_bullets, cls.n_bullets + n)
 
-        self.set_dim(state['dim'], scale=True)
-        self.set_surface(state['image'])
+        cls.positions[s] = positions
+        cls.oriens[s] = oriens
+        cls.speeds[s] = speed
+        cls.damages[s] = damages
+        cls.teams[s] = team
+        cls.ids[s] = ids
 
-Explosion.setup_states()
+        cls.velocities[s, 0] = np.cos(-cls.oriens[s]) * cls.speeds[s]
+        cls.velocities[s, 1] = np.sin(-cls.oriens[s]) * cls.speeds[s]
 
-class BulletSystem:
-    '''
-    Static object.  
-    Manage bullets, explosions.    
-    Update position, display, collisions...
-    '''
-    game_client = None
-    bullets = []
-    recent_ids = {'id':[], 'lifetime':[]}
-    explosions = []
-    own_player = None
-    opp_player = None
+        if not ages is None:
+            cls.positions[s] += np.reshape(ages, (n,1)) * cls.velocities[s]
 
-    @classmethod
-    def set_players(cls, own_player, opp_player):
-        '''
-        Set a reference of both players, use for the collisions.
-        '''
-        cls.own_player = own_player
-        cls.opp_player = opp_player
+        cls.n_bullets += n
 
     @classmethod
-    def reset(cls):
+    def _keep_bullets(cls, keep):
         '''
-        Reset the bulletsystem.
+        Given a boolean array (one value per alive bullet),
+        remove the bullets with a False value.
         '''
-        cls.bullets = []
-        cls.explosions = []
-        cls.own_player = None
-        cls.opp_player = None
+        n = np.count_nonzero(keep)
+
+        if n == cls.n_bullets:
+            return
+
+        for array in (cls.positions, cls.velocities, cls.oriens,
+                    cls.speeds, cls.damages, cls.teams, cls.ids):
+            array[:n] = array[:cls.n_bullets][keep]
+
+        cls.n_bullets = n
 
-    @classmethod
-    def add_bullet(cls, bullet):
-        '''
-        Add a bullet to be managed by the bullet system.
-        '''
-        cls.bullets.append(bullet)
-    
     @classmethod
     def get_bullets_by_team(cls, team):
         '''
-        Return all the bullets of the specified team.
+        Return the indexes of the bullets of the specified team.
         '''
-        selected_bullets = []
-        for bullet in cls.bullets:
-            if bullet.team == team:
-                selected_bullets.append(bullet)
-        
-        return selected_bullets
+        return np.flatnonzero(cls.teams[:cls.n_bullets] == team)
 
     @classmethod
     def erase_bullets_by_team(cls, team):
         '''
         Erase bullets of specified team.
         '''
-        for bullet in cls.bullets:
-            if bullet.team == team:
-                cls.bullets.remove(bullet)
+        cls._keep_bullets(cls.teams[:cls.n_bullets] != team)
 
     @classmethod
-    def get_bullet_by_pos(cls, pos, margin=2):
+    def pop_events(cls):
         '''
-        Return the bullet with the specified position (unscaled),  
-        Take a margin to catch any potential miss truncated,  
-        if no bullet is found: return None
+        Return the events of the own bullets since the last call:  
+        the spawns (id, x, y, orien, damage) as an int array and the ids of the despawns.
         '''
-        pos = [int(pos[0]), int(pos[1])]
+        spawns = np.array(cls._spawn_events, dtype='int32').reshape((-1,5))
+        despawns = np.array(cls._despawn_events, dtype='int32')
 
-        for bullet in cls.bullets:
-            
-            is_it = True
-            x, y = bullet.get_pos()
-            x = int(x)
-            y = int(y)
-
-            if not x - margin <= pos[0] <= x + margin:
-                is_it = False
+        cls._spawn_events = []
+        cls._despawn_events = []
 
-            if not y - margin <= pos[1] <= y + margin:
-                is_it = False
+        return spawns, despawns
 
-            if is_it:
-                return bullet
-            
     @classmethod
     def update_opp_bullets(cls):
         '''
-        Update the opponent bullets.
+        Update the opponent bullets:
+        add the spawned ones, remove the despawned ones.  
+        The bullets are then moved locally.
         '''
-        cls.erase_bullets_by_team(cls.opp_player.team)
+        bullets, removed = cls.game_client.get_opp_bullets()
 
-        cls.bullets.extend(cls.game_client.bullets)
+        cls.add_bullets(cls.opp_player.team, bullets[:,1:3], 1e-4 * bullets[:,3],
+                    bullets[:,4], bullets[:,0], ages=bullets[:,5])
 
-        cls.game_client.bullets = []
+        if len(removed) > 0:
+            n = cls.n_bullets
+            is_removed = (cls.teams[:n] == cls.opp_player.team) & np.isin(cls.ids[:n], removed)
+            cls._keep_bullets(~is_removed)
 
     @classmethod
     @Counter.add_func
@@ -219,37 +247,140 @@ class BulletSystem:
         If remote_control=True, the bullet hitting the opponent ship
         won't cause any damage -> control on opp local
         '''
-        for i, life in enumerate(cls.recent_ids['lifetime']):
-            life -= 1
-            if life == 0:
-                cls.recent_ids['id'].pop(i)
-                cls.recent_ids['lifetime'].pop(i)
+        cls.recent_lifetimes -= 1
+        alive = cls.recent_lifetimes > 0
+        cls.recent_ids = cls.recent_ids[alive]
+        cls.recent_teams = cls.recent_teams[alive]
+        cls.recent_lifetimes = cls.recent_lifetimes[alive]
 
-        for expl in cls.explosions:
-            expl.update_state()
-            
-            if expl.to_delete:
-                cls.explosions.remove(expl)
+        cls.update_explosions()
 
-        for bullet in cls.bullets:
-            bullet.update_state()
+        cls.positions[:cls.n_bullets] += cls.velocities[:cls.n_bullets]
         
         cls.check_in_dim()
         cls.handeln_collision(remote_control=remote_control)
     
     @classmethod
-    def display(cls):
+    def update_explosions(cls):
         '''
-        Display every bullet & explosion,  
+        Update the lifetime of the explosions, remove the ended ones,
+        set a random frame to the others.
+        '''
+        n = cls.n_expl
+        cls.expl_lifetimes[:n] -= 1
+
+        keep = cls.expl_lifetimes[:n] > 0
+        n = np.count_nonzero(keep)
+
+        for array in (cls.expl_positions, cls.expl_lifetimes, cls.expl_frames):
+            array[:n] = array[:cls.n_expl][keep]
+        
+        cls.n_expl = n
+        cls.expl_frames[:n] = cls._rng.integers(1, Spec.N_FRAMES_EXPL, size=n)
+
+    @classmethod
+    def add_explosion(cls, pos):
         '''
+        Add an explosion at the given position (center, unscaled),
+        if there are already `Spec.MAX_EXPL` explosions, remove the oldest one.
+        '''
+        if cls.n_expl == Spec.MAX_EXPL:
+            for array in (cls.expl_positions, cls.expl_lifetimes, cls.expl_frames):
+                array[:-1] = array[1:].copy()
+            cls.n_expl -= 1
         
-        for bullet in cls.bullets:
-            pos = np.array(bullet.get_pos(scaled=True))
-            bullet.display(pos=pos)
+        i = cls.n_expl
+        cls.expl_positions[i] = pos
+        cls.expl_lifetimes[i] = Spec.TIME_EXPL
+        cls.expl_frames[i] = 0
+        cls.n_expl += 1
+
+    @classmethod
+    def _check_sprites_factor(cls):
+        '''
+        Reset the cached images if the window has been rescaled.
+        '''
+        if cls._sprites_factor != Dimension.get_factor():
+            cls._sprites_factor = Dimension.get_factor()
+            cls._sprites = {}
+            cls._expl_frames = []
+
+    @classmethod
+    def _get_expl_frames(cls):
+        '''
+        Return the (scaled) images of the explosions:
+        the first one is the initial (intermediate dimension, not rotated),
+        the others have a random dimension and rotation.
+        '''
+        cls._check_sprites_factor()
+
+        if len(cls._expl_frames) > 0:
+            return cls._expl_frames
+
+        dim = (Spec.DIM_MAX_EXPL + Spec.DIM_MIN_EXPL)//2
+        img = pygame.transform.scale(img_expl, Dimension.scale(dim).astype(int))
+        cls._expl_frames.append(img)
+
+        for i in range(Spec.N_FRAMES_EXPL - 1):
+            dim = cls._rng.integers(Spec.DIM_MIN_EXPL[0], Spec.DIM_MAX_EXPL[0], size=2)
+            img = pygame.transform.rotate(img_expl, int(cls._rng.integers(360)))
+            img = pygame.transform.scale(img, Dimension.scale(dim).astype(int))
+            cls._expl_frames.append(img)
         
-        for expl in cls.explosions:
-            pos = np.array(expl.get_pos(scaled=True))
-            expl.display(pos=pos)
+        return cls._expl_frames
+
+    @classmethod
+    def _get_sprite(cls, orien):
+        '''
+        Return the rotated (scaled) image of a bullet,
+        given its orientation (rad),
+        the sprites are cached by angle (deg).
+        '''
+        cls._check_sprites_factor()
+
+        angle = int(round(get_deg(orien))) % 360
+
+        if not angle in cls._sprites:
+            dim = Dimension.scale(Spec.DIM_BULLET).astype(int)
+            img = pygame.transform.scale(img_bullet, dim)
+            img = pygame.transform.rotate(img, angle)
+            cls._sprites[angle] = img
+
+        return cls._sprites[angle]
+
+    @classmethod
+    def _get_topleft(cls, position, sprite):
+        '''
+        Return the (scaled) top left position of a bullet,
+        given its (unscaled) position and its sprite.
+        '''
+        center = Dimension.scale(position)
+        return (center - np.array(sprite.get_size()) / 2).astype(int)
+
+    @classmethod
+    def display(cls, alpha=1):
+        '''
+        Display every bullet & explosion,  
+        `alpha` is the interpolation factor between the previous (0)
+        and current (1) simulation step.
+        '''
+        blits = []
+
+        # the bullets move in straight line -> step back along the velocity
+        n = cls.n_bullets
+        positions = cls.positions[:n] - (1 - alpha) * cls.velocities[:n]
+
+        for i in range(n):
+            img = cls._get_sprite(cls.oriens[i])
+            blits.append((img, cls._get_topleft(positions[i], img)))
+
+        frames = cls._get_expl_frames()
+
+        for i in range(cls.n_expl):
+            img = frames[cls.expl_frames[i]]
+            blits.append((img, cls._get_topleft(cls.expl_positions[i], img)))
+
+        Interface.screen.blits(blits, doreturn=False)
     
     @classmethod
     def check_in_dim(cls):
@@ -258,17 +389,14 @@ class BulletSystem:
         with a margin factor to handeln ships moving outside initial screen.  
         if not: remove the bullet.
         '''
-        margin = Dimension.scale(Spec.DIM_SHIP)[0]
-        # get scaled window dimension
-        window_x = Dimension.get_x(scaled=True)
-        window_y = Dimension.get_y(scaled=True)
+        margin = Spec.DIM_SHIP[0]
+        window = np.array([Dimension.get_x(), Dimension.get_y()])
 
-        for bullet in cls.bullets:
-            x, y = bullet.get_pos(scaled=True)
-            
-            if not (-margin < y < window_y + margin) or not (-margin < x < window_x + margin):
-                # remove bullet
-                cls.bullets.remove(bullet)
+        positions = cls.positions[:cls.n_bullets]
+
+        keep = np.all((positions > -margin) & (positions < window + margin), axis=1)
+
+        cls._keep_bullets(keep)
 
     @classmethod
     def handeln_collision(cls, remote_control=True):
@@ -285,52 +413,56 @@ class BulletSystem:
         Check if ship has been hit by one of the bullet.  
         If yes, handeln collision.
         '''
-
         ship = player.ship
+        n = cls.n_bullets
 
-        threshold = Dimension.scale(get_norm(Spec.DIM_SHIP))
+        # only keep the opponent's bullets that didn't already hit
+        recent = cls.recent_ids[cls.recent_teams != player.team]
 
-        pos_ship = ship.get_pos(scaled=True)
-        center_ship = ship.get_pos(center=True, scaled=True)
+        candidates = (cls.teams[:n] != player.team) & ~np.isin(cls.ids[:n], recent)
+        candidates = np.flatnonzero(candidates)
 
-        for bullet in cls.bullets:
-            
-            if bullet.team == player.team or bullet.id in cls.recent_ids['id']:
-                continue
+        if len(candidates) == 0:
+            return
 
-            pos_bullet = bullet.get_pos(scaled=True)
+        # get the touched block (if any) of each bullet
+        keys = ship.get_keys_by_pos(cls.positions[candidates])
 
-            offset_to_center = np.array(pos_bullet - center_ship, dtype='int32')
+        hits = []
 
-            if get_norm(offset_to_center) > threshold:
-                continue
+        for i, key in zip(candidates, keys):
 
-            # check for collision
-            mask_ship = ship.get_mask()
+            # the block can have been destroyed by a previous bullet
+            if not key in ship.blocks:
+                continue
 
-            offset = np.array(pos_bullet - pos_ship, dtype='int32')
+            if is_bullet_damage:
+                damage = cls.damages[i]
+            else:
+                damage = 0
 
-            intersect = mask_ship.overlap(bullet.mask, offset)
+            ship.handeln_collision(damage, key)
+            cls.handeln_collision_effect(i)
+            hits.append(i)
 
-            if not intersect is None:
+        if len(hits) == 0:
+            return
 
-                if not is_bullet_damage:
-                    bullet.damage = 0
+        if cls.is_replicated and player is cls.opp_player:
+            cls._despawn_events.extend(cls.ids[hits].tolist())
 
-                ship.handeln_collision(bullet, pos_bullet)
-                cls.handeln_collision_effect(bullet, pos_bullet)
+        keep = np.ones(n, dtype=bool)
+        keep[hits] = False
+        cls._keep_bullets(keep)
 
     @classmethod
-    def handeln_collision_effect(cls, bullet, intersect):
+    def handeln_collision_effect(cls, idx):
         '''
-        Remove bullet.  
-        Create an explosion object.
+        Store the bullet as recent (prevent it to hit twice).  
+        Add an explosion.
         '''
-        cls.bullets.remove(bullet)
-        cls.recent_ids['id'].append(bullet.id)
-        cls.recent_ids['lifetime'].append(Spec.TIME_EXPL)
-
-        expl = Explosion(intersect)
-        cls.explosions.append(expl)
+        cls.recent_ids = np.append(cls.recent_ids, cls.ids[idx])
+        cls.recent_teams = np.append(cls.recent_teams, cls.teams[idx])
+        cls.recent_lifetimes = np.append(cls.recent_lifetimes, Spec.TIME_EXPL)
 
-        
\ No newline at end of file
+        cls.add_explosion(cls.positions[idx])
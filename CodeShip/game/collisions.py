@@ -15,6 +15,9 @@ class CollisionSystem:
     HISTORY_SIZE = 10
     intersect = None
 
+    # random generator of the game
+    rng = np.random.default_rng()
+
     # store player's speeds
     speed_history = {
         'own': [],
@@ -33,13 +36,14 @@ class CollisionSystem:
         }
 
     @classmethod
-    def set_ships(cls, own_ship, opp_ship):
+    def set_ships(cls, own_ship, opp_ship, rng):
         '''
-        Set ships,  
+        Set ships and the random generator of the game,  
         NOTE: ship must be in correct order.
         '''
         cls.own_ship = own_ship
         cls.opp_ship = opp_ship
+        cls.rng = rng
 
     @classmethod
     def update_history(cls):
@@ -121,7 +125,7 @@ class CollisionSystem:
         ship.speed = -to_vect(speed, angle)
 
         # add random rotation
-        if np.random.random() < .5:
+        if cls.rng.random() < .5:
             sign = -1
         else:
             sign = 1
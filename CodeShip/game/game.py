@@ -6,7 +6,8 @@ from game.api import API
 from game.interface import GameInterface
 from game.player import Player
 from game.bot import BotPlayer
-from lib.plougame import Dimension
+from game.lockstep import Lockstep, RemotePlayer, RemoteAPI
+from lib.plougame import Interface, Dimension
 from lib.perfeval import Counter
 from data.spec import Spec
 import importlib, traceback, time
@@ -14,7 +15,7 @@ import numpy as np
 
 class Game:
 
-    def __init__(self, ui_client, connected=True):
+    def __init__(self, ui_client, connected=True, headless=False):
 
         self.ui_client = ui_client
         Player.client = ui_client
@@ -31,6 +32,16 @@ class Game:
         # if one of the player is a bot
         self._is_bot = False
 
+        # if the game is simulated without any display
+        self.headless = headless
+
+        # result of the last game: (has_win, cause)
+        self.end_state = None
+
+        # fixed timestep simulation clock
+        self._last_time = None
+        self._accumulator = 0
+
         self.game_client = None
         self.has_init_info = False
 
@@ -62,43 +73,66 @@ class Game:
         if value:
             self._is_running = True
             self._is_game_active = True
+
+            # render faster than the simulation, see `display`
+            Interface.set_fps(Spec.GAME_FPS)
         else:
             raise ValueError("Can't set running to False.")
 
     def setup(self, team, own_grid, opp_grid, own_username, opp_username, 
-            initiate_api=True):
+            initiate_api=True, token=0, seed=None):
         '''
         Set up `Game` instance for the game,
         given:  
         `team` : Set the team used to set the position, color of the ships.  
         `own/opp grid` : the grids used to create the ships.  
         `own/opp username` : the usernames used to set up the game's interface.  
-        `initate_api`: if True, the `setup_api` method and `init_script` method will be executed
+        `initate_api`: if True, the `setup_api` method and `init_script` method will be executed  
+        `token`: the session token given by the server (udp messages)  
+        `seed`: the seed of the game's random generator given by the server (same for both users)
         '''
         self.reset_values()
         self.running = True
         self._is_bot = False
+        self._reset_clock()
+        self.end_state = None
 
         # update quit button state
         self.interface.set_quit_button("online")
 
+        if Spec.LOCKSTEP:
+            opp_player = RemotePlayer(opp_username, (-team + 3), opp_grid)
+        else:
+            opp_player = Player(opp_username, (-team + 3), opp_grid)
+
         self.players = {
             'own': Player(own_username, team, own_grid, with_script=True),
-            'opp': Player(opp_username, (-team + 3), opp_grid),
+            'opp': opp_player,
         }
 
         if not self.game_client is None:
+            self.game_client.set_token(token)
             self.game_client.set_opp_team(self.players['opp'].team)
 
         self.setup_interface()
         API.set_players(self.players['own'], self.players['opp'])
-        BulletSystem.set_players(self.players['own'], self.players['opp'])
-        CollisionSystem.set_ships(self.players['own'].ship, self.players['opp'].ship)
+
+        if Spec.LOCKSTEP:
+            Lockstep.setup(self.game_client, self.players['own'], self.players['opp'], seed)
+            self.setup_rng(Lockstep.seed)
+            # same order on both clients
+            first, second = Lockstep.players
+            BulletSystem.set_players(first, second)
+            CollisionSystem.set_ships(first.ship, second.ship, self.rng)
+        else:
+            self.setup_rng()
+            BulletSystem.set_players(self.players['own'], self.players['opp'], is_replicated=True)
+            CollisionSystem.set_ships(self.players['own'].ship, self.players['opp'].ship, self.rng)
 
         if initiate_api:
             self.init_script()
 
-    def setup_with_bot(self, team, own_grid, own_username):
+    def setup_with_bot(self, team, own_grid, own_username, botname='bot1', seed=None):
         '''
         Set up `Game` instance for the game,
         with one of the player being a bot,
@@ -106,29 +140,44 @@ class Game:
         `team` : Set the team used to set the position, color of the ships.  
         `own_grid` : the grid used to create the ship.  
         `own_username` : the username used to set up the game's interface.  
+        `botname` : the name of the bot (see game/bots)  
+        `seed` : the seed of the game's random generator (None: random)
         '''
         self.reset_values()
         self.running = True
         self._is_bot = True
+        self._reset_clock()
+        self.end_state = None
 
         # add quit button to the interface
         self.interface.set_quit_button('offline')
 
         self.players = {
             'own': Player(own_username, team, own_grid, with_script=True),
-            'opp': BotPlayer(-team + 3, 'bot1'),
+            'opp': BotPlayer(-team + 3, botname),
         }
 
         self.setup_interface()
         self.interface.has_opp_max_shield = True
 
         API.set_players(self.players['own'], self.players['opp'])
+        self.setup_rng(seed)
         BulletSystem.set_players(self.players['own'], self.players['opp'])
-        CollisionSystem.set_ships(self.players['own'].ship, self.players['opp'].ship)
+        CollisionSystem.set_ships(self.players['own'].ship, self.players['opp'].ship, self.rng)
 
         self.init_script(send_data=False)
         self.players['opp'].initiate(self.players['own'])
 
+    def setup_rng(self, seed=None):
+        '''
+        Create the random generator of the game (used by the simulation),
+        the global random state is never used -> the script can't modify it.
+        '''
+        self.rng = np.random.default_rng(seed)
+
+        for player in self.players.values():
+            player.ship.rng = self.rng
+
     def setup_interface(self):
         '''
         set up the game interface,  
@@ -194,6 +243,7 @@ class Game:
         if ended:
             self._is_game_active = False
             self.has_init_info = False
+            self.end_state = (has_win, cause)
             self.interface.set_end_game(has_win, cause)
 
             if send_data:
@@ -205,6 +255,8 @@ class Game:
         Quit the game, return to the ui.  
         '''
         self._is_running = False
+        Interface.set_fps()
+
         # reset game interface
         self.interface.change_state('base')
 
@@ -222,12 +274,21 @@ class Game:
         Run "init" function of user's script.  
         Set up blocks that need to be set up (Shield).  
         Send after init state to opponent.  
-        Initiate the API
+        Initiate the API.  
+        In lockstep mode, send the orders of the `init` function.
         '''
+        is_lockstep = Spec.LOCKSTEP and not self._is_bot
+
+        if is_lockstep:
+            API._inputs = []
+
         self.players['own'].call_script_init(send_data=send_data)
         API.init()
         self.players['own'].finalize_initiation(send_data=send_data)
 
+        if is_lockstep:
+            Lockstep.start(API._inputs)
+
     def test_script(self, grid):
         '''
         Test the user sript at runtime.  
@@ -274,16 +335,109 @@ class Game:
             
             self.players['opp'].n_script_error = n
 
+    def _reset_clock(self):
+        '''
+        Reset the simulation clock.
+        '''
+        self._last_time = None
+        self._accumulator = 0
+
+    def _get_n_ticks(self) -> int:
+        '''
+        Update the simulation clock with the time elapsed since the last frame,  
+        return the number of simulation steps to perform in the current frame.
+        '''
+        tick_duration = 1 / Spec.TICK_RATE
+        now = time.perf_counter()
+
+        if self._last_time is None:
+            # first frame: perform one step
+            self._accumulator = tick_duration
+        else:
+            self._accumulator += now - self._last_time
+        
+        self._last_time = now
+
+        n_ticks = int(self._accumulator // tick_duration)
+
+        if n_ticks > Spec.MAX_TICKS_PER_FRAME:
+            # rendering is too slow -> drop the extra time
+            n_ticks = Spec.MAX_TICKS_PER_FRAME
+            self._accumulator = n_ticks * tick_duration
+
+        self._accumulator -= n_ticks * tick_duration
+
+        return n_ticks
+
+    def _get_alpha(self) -> float:
+        '''
+        Return the interpolation factor between the last two simulation steps,
+        the fraction of a step elapsed since the last one.
+        '''
+        if not self._is_game_active:
+            return 1
+
+        return min(1, self._accumulator * Spec.TICK_RATE)
+
+    def _run_ticks(self, update, is_ready=None):
+        '''
+        Perform the simulation steps of the current frame,
+        given the update method of one step.  
+        `is_ready`: optional function, return if a step can be performed,
+        if not, the remaining steps are kept for the next frames.
+        '''
+        n_ticks = self._get_n_ticks()
+
+        for i in range(n_ticks):
+
+            if not self._is_game_active:
+                break
+
+            if not is_ready is None and not is_ready():
+                # keep the time of the remaining steps
+                n_ticks = min(n_ticks - i, Spec.MAX_TICKS_PER_FRAME)
+                self._accumulator += n_ticks / Spec.TICK_RATE
+                break
+
+            for player in self.players.values():
+                player.ship.save_state()
+
+            update()
+
     @Counter.add_func
     def run(self, pressed, events):
         '''
-        Run the game.
+        Run the game.  
+        The game is simulated with a fixed timestep (see `Spec.TICK_RATE`),
+        independently of the number of rendered frames.
         '''
         if self._is_bot:
             self._run_with_bot(pressed, events)
         else:
             self._run_normal(pressed, events)
 
+    def simulate(self, max_frames=None):
+        '''
+        Run a game with a bot (see `setup_with_bot`) as fast as possible,
+        without any display nor frame cap,
+        until the game ends or `max_frames` frames have been simulated.  
+        Return the number of simulated frames.
+        '''
+        if not self._is_bot:
+            raise ValueError("Only a game with a bot can be simulated.")
+
+        n_frame = 0
+
+        while self._is_game_active:
+
+            if not max_frames is None and n_frame >= max_frames:
+                break
+
+            self._update_with_bot()
+            n_frame += 1
+
+        return n_frame
+
     def _run_normal(self, pressed, events):
         '''
         Run the game.  
@@ -294,49 +448,90 @@ class Game:
 
         self._update_opp_script_error()
 
-        if self._is_game_active:
-            CollisionSystem.run()
-            BulletSystem.run()
-            BulletSystem.update_opp_bullets()
-            API.run()
+        if self._is_game_active and Spec.LOCKSTEP:
+            self._run_ticks(self._update_lockstep, is_ready=Lockstep.is_ready)
+            # send again the inputs not yet received by the opponent
+            self.game_client.flush_inputs()
 
-            self.game_client.set_opp_state(self.players['opp'])
+        elif self._is_game_active:
+            self._run_ticks(self._update_normal)
 
-            self.players['opp'].run(remote_control=True)
-            self.players['own'].run()
+        if not self.headless:
+            self._display(pressed, events)
 
-            # send state to server
-            self.game_client.send_state(self.players['own'])
+    def _update_normal(self):
+        '''
+        Update the state of the game (one simulation step),
+        with one player in local and one player remotely controlled.
+        '''
+        CollisionSystem.run()
+        BulletSystem.run()
+        BulletSystem.update_opp_bullets()
+        API.run()
 
-            self.check_end_game()
+        self.game_client.set_opp_state(self.players['opp'])
 
-        self.players['own'].display()
-        self.players['opp'].display()
+        self.players['opp'].run(remote_control=True)
+        self.players['own'].run()
 
-        BulletSystem.display()
+        # send state to server
+        self.game_client.send_state(self.players['own'])
 
-        self.interface.react_events(pressed, events)
-        self.interface.update()
-        self.interface.display()
+        self.check_end_game()
+
+    def _update_lockstep(self):
+        '''
+        Update the state of the game (one simulation step), in lockstep mode:  
+        both ships are simulated locally, given the inputs of both players.
+        '''
+        CollisionSystem.run(remote_control=False)
+        BulletSystem.run(remote_control=False)
+
+        Lockstep.apply_frame_inputs()
+        API.run()
+        RemoteAPI.run()
+
+        for player in Lockstep.players:
+            player.run()
+
+        Lockstep.end_frame()
+
+        self.check_end_game()
 
     def _run_with_bot(self, pressed, events):
         '''
         Run the game with a bot.
         '''
         if self._is_game_active:
-            CollisionSystem.run(remote_control=False)
-            BulletSystem.run(remote_control=False)
-            API.run()
+            self._run_ticks(self._update_with_bot)
+
+        if not self.headless:
+            self._display(pressed, events)
+
+    def _update_with_bot(self):
+        '''
+        Update the state of the game (one simulation step), with a bot.
+        '''
+        CollisionSystem.run(remote_control=False)
+        BulletSystem.run(remote_control=False)
+        API.run()
+
+        self.players['opp'].run(send_data=False)
+        self.players['own'].run(send_data=False)
 
-            self.players['opp'].run(send_data=False)
-            self.players['own'].run(send_data=False)
+        self.check_end_game(send_data=False)
 
-            self.check_end_game(send_data=False)
+    def _display(self, pressed, events):
+        '''
+        Display the ships, bullets and the game interface,  
+        interpolated between the last two simulation steps.
+        '''
+        alpha = self._get_alpha()
 
-        self.players['own'].display()
-        self.players['opp'].display()
+        self.players['own'].display(alpha)
+        self.players['opp'].display(alpha)
 
-        BulletSystem.display()
+        BulletSystem.display(alpha)
 
         self.interface.react_events(pressed, events)
         self.interface.update()
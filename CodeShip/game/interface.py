@@ -219,7 +219,7 @@ class GameInterface(Page):
         '''
         # get total hp of ship
         total_hp = Spec.HP_BLOCK * ship.initial_n_block
-        current_hp = sum((block.hp for block in ship.blocks.values()))
+        current_hp = np.sum(ship.states.hp)
 
         # set green form length
         dim_x = (current_hp / total_hp) * DIM_HP[0]
@@ -236,7 +236,7 @@ class GameInterface(Page):
 
         shields = player.ship.typed_blocks['Shield']
         total_hp = player.total_shield_hp
-        current_hp = sum((block.hp_shield for block in player.ship.blocks.values()))
+        current_hp = np.sum(player.ship.states.hp_shield)
 
         # set blue form length
         if total_hp == 0:
@@ -270,11 +270,9 @@ class GameInterface(Page):
         Set the engine level info of the specified player
         '''
         # get total motor force (percentage)
-        total_force = 0
-        for block in ship.typed_blocks['Engine']:
-            total_force += block.activation_per
+        total_force = ship.states.get_engines_activation()
 
-        self._set_value(0, f'{100*total_force}%', team)
+        self._set_value(0, f'{100*total_force:.0f}%', team)
 
     def update_api_actions(self, player):
         '''
@@ -0,0 +1,332 @@
+from game.api import API, Opponent, Ship, Constants
+from game.block import Block
+from game.player import Player
+from game.bulletsystem import BulletSystem
+from lib.console import Console
+from data.spec import Spec
+import zlib, numbers
+import numpy as np
+
+# create copy of API's static objects (copy of classes)
+# used to give the orders of the opponent's script to its ship
+RemoteAPI = type('RemoteAPI', API.__bases__, dict(API.__dict__))
+RemoteOpponent = type('RemoteOpponent', Opponent.__bases__, dict(Opponent.__dict__))
+RemoteShip = type('RemoteShip', Ship.__bases__, dict(Ship.__dict__))
+
+RemoteAPI._ship_cls = RemoteShip
+RemoteAPI._opponent_cls = RemoteOpponent
+
+RemoteShip._api = RemoteAPI
+RemoteOpponent._api = RemoteAPI
+
+class RemotePlayer(Player):
+    '''
+    Lockstep version of Player
+
+    The ship is simulated locally,
+    given the orders of the opponent's script (received from the opponent).
+    '''
+
+    def __init__(self, username, team, grid):
+
+        super().__init__(username, team, grid)
+
+        self.is_initiated = False
+
+    def call_script_main(self, send_data=True):
+        '''
+        Overwrite of Player.call_script_main method,
+        the script is executed by the opponent.
+        '''
+        return None
+
+    def initiate(self, player, inputs):
+        '''
+        Initialize the API,
+        given the other player and the inputs of the opponent's `init` function.
+        '''
+        RemoteAPI.reset()
+
+        # set the used API object to RemoteAPI to creates the api's blocks
+        Constants._CURRENT_API_ = RemoteAPI
+
+        RemoteAPI.set_players(self, player)
+
+        # reset default value
+        Constants._CURRENT_API_ = API
+
+        Lockstep.apply_inputs(RemoteAPI, inputs)
+        RemoteAPI.init()
+        self.finalize_initiation(send_data=False)
+
+        self.is_initiated = True
+
+class Lockstep:
+    '''
+    Static object.
+
+    Input-only netcode: the players only send the orders given by
+    their script (inputs), tagged with the frame at which they are executed.
+    Both clients simulate the two ships, with the same seed,
+    the own inputs are delayed of `Spec.LOCKSTEP_DELAY` frames to give time
+    to the opponent to receive them.
+    A hash of the game's state is periodically compared to detect desyncs.
+
+    Methods
+    ---
+    `setup`: Set up the lockstep for a new game
+    `start`: Send the inputs of the `init` function
+    `is_ready`: Return if the inputs of the current frame are available
+    `apply_frame_inputs`: Execute the inputs of the current frame
+    `end_frame`: Send the inputs of the script, go to the next frame
+    '''
+
+    game_client = None
+    own_player = None
+    remote_player = None
+
+    # sorted by team -> same order on both clients
+    players = []
+
+    frame = 0
+    desync_frame = None
+
+    # seed of the random generator of the game, same on both clients
+    seed = None
+
+    # own inputs waiting to be executed, key: frame
+    _own_inputs = {}
+    # own hashes, key: frame
+    _own_hashes = {}
+
+    @classmethod
+    def setup(cls, game_client, own_player, remote_player, seed):
+        '''
+        Set up the lockstep for a new game,
+        set the seed of the game's random generator (given by the server).
+        '''
+        cls.game_client = game_client
+        cls.own_player = own_player
+        cls.remote_player = remote_player
+        cls.players = sorted((own_player, remote_player), key=lambda player: player.team)
+
+        cls.frame = 0
+        cls.desync_frame = None
+        cls._own_inputs = {}
+        cls._own_hashes = {}
+
+        cls.seed = seed
+
+    @classmethod
+    def start(cls, setup_inputs: list):
+        '''
+        Send the inputs of the `init` function,
+        start to record the inputs of the script.
+        '''
+        cls.game_client.send_inputs(-1, cls._serialize(setup_inputs))
+
+        # nothing is executed on the first frames
+        for frame in range(Spec.LOCKSTEP_DELAY):
+            cls._own_inputs[frame] = []
+            cls.game_client.send_inputs(frame, [])
+
+        API._inputs = []
+        API._defer_inputs = True
+
+    @classmethod
+    def is_ready(cls) -> bool:
+        '''
+        Return if the inputs of the opponent for the current frame
+        have been received (and so if the frame can be simulated).
+        '''
+        if not cls.remote_player.is_initiated:
+
+            if cls.game_client.remote_frame < -1:
+                return False
+
+            inputs = cls.game_client.remote_inputs.pop(-1)
+            cls.remote_player.initiate(cls.own_player, inputs)
+
+        return cls.game_client.remote_frame >= cls.frame
+
+    @classmethod
+    def apply_frame_inputs(cls):
+        '''
+        Execute the inputs of both players of the current frame.
+        '''
+        inputs = {
+            cls.own_player.team: cls._own_inputs.pop(cls.frame, []),
+            cls.remote_player.team: cls.game_client.remote_inputs.pop(cls.frame, []),
+        }
+
+        for player in cls.players:
+            api = API if player is cls.own_player else RemoteAPI
+            cls.apply_inputs(api, inputs[player.team])
+
+    @classmethod
+    def end_frame(cls):
+        '''
+        Send the inputs recorded during the frame,
+        periodically compute the state hash,
+        go to the next frame.
+        '''
+        inputs = cls._serialize(API._inputs)
+        API._inputs = []
+
+        frame = cls.frame + Spec.LOCKSTEP_DELAY
+        cls._own_inputs[frame] = inputs
+
+        state_hash = None
+
+        if cls.frame % Spec.LOCKSTEP_HASH_INTERVAL == 0:
+            state_hash = (cls.frame, cls.get_state_hash())
+            cls._own_hashes[cls.frame] = state_hash[1]
+
+        cls.game_client.send_inputs(frame, inputs, state_hash=state_hash)
+
+        cls._check_hashes()
+        cls.frame += 1
+
+    @classmethod
+    def _check_hashes(cls):
+        '''
+        Compare the own hashes with the received ones.
+        '''
+        remote_hashes = cls.game_client.remote_hashes
+
+        for frame in list(remote_hashes.keys()):
+
+            if not frame in cls._own_hashes:
+                continue
+
+            if remote_hashes.pop(frame) != cls._own_hashes.pop(frame) and cls.desync_frame is None:
+                cls.desync_frame = frame
+                Console.print(f"[UDP] [WARNING] Lockstep desync detected at frame {frame}.")
+
+    @classmethod
+    def get_state_hash(cls) -> int:
+        '''
+        Return a hash of the state of the game (ships & bullets).
+        '''
+        value = 0
+
+        for player in cls.players:
+            ship = player.ship
+
+            for array in (ship.pos, ship.speed, np.array([ship.orien]),
+                        ship.states.hp, ship.states.hp_shield, ship.states.active):
+                value = zlib.crc32(array.tobytes(), value)
+
+        positions = BulletSystem.positions[:BulletSystem.n_bullets]
+        value = zlib.crc32(positions.tobytes(), value)
+
+        return value
+
+    @classmethod
+    def _serialize(cls, inputs: list) -> list:
+        '''
+        Replace the blocks given as argument by their key,
+        only keep the last engine order of each engine.  
+        The values are converted to bool/int/float (as sent to the opponent),
+        the orders with other values are ignored.
+        '''
+        ship = cls.own_player.ship
+        orders = []
+        engines = {}
+
+        for order in inputs:
+
+            try:
+                if order[0] == 'rotate':
+                    order = ('rotate', cls._get_value(order[1]))
+
+                elif order[0] == 'action':
+                    name, key, func, args, kwargs, delay, desc = order
+                    args = tuple(cls._get_value(cls._get_key(arg, ship)) for arg in args)
+                    kwargs = {name: cls._get_value(value) for name, value in kwargs.items()}
+                    order = ('action', key, func, args, kwargs, delay, desc)
+
+                elif order[0] == 'engine':
+                    engines[order[1]] = ('engine', order[1], cls._get_value(order[2]))
+                    continue
+
+            except ValueError:
+                continue
+
+            orders.append(order)
+
+        return orders + list(engines.values())
+
+    @staticmethod
+    def _get_key(arg, ship):
+        '''
+        Return ('block', key) if the argument is a block, else the argument.
+        '''
+        if isinstance(arg, Block):
+            x, y = arg.coord
+            return ('block', int(ship.blocks_grid[x,y]))
+        return arg
+
+    @classmethod
+    def _get_value(cls, value):
+        '''
+        Return the value as a bool, int or float (blocks' keys are kept),
+        raise a ValueError if it isn't a number.
+        '''
+        if cls._is_key(value) and type(value[1]) == int and 0 <= value[1] < 2**16:
+            return value
+        elif isinstance(value, (bool, np.bool_)):
+            return bool(value)
+        elif isinstance(value, numbers.Integral) and abs(value) < 2**63:
+            return int(value)
+        elif isinstance(value, numbers.Real) and np.isfinite(value):
+            return float(value)
+        
+        raise ValueError(f"Invalid value: {value}.")
+
+    @staticmethod
+    def _is_key(arg) -> bool:
+        '''
+        Return if the argument is a block's key (see `_get_key`).
+        '''
+        return type(arg) == tuple and len(arg) == 2 and arg[0] == 'block'
+
+    @classmethod
+    def apply_inputs(cls, api, inputs: list):
+        '''
+        Execute the given inputs on the ship of the api (`API` or `RemoteAPI`),
+        the orders on blocks that have been destroyed are ignored.
+        '''
+        ship = api._ships['own']
+        api_blocks = {block.key: block for block in api._ship_cls.blocks}
+
+        # don't record the executed orders
+        recorded = api._inputs
+        api._inputs = None
+
+        for order in inputs:
+
+            if order[0] == 'rotate':
+                api._ship_cls.rotate_target(order[1])
+
+            elif order[0] == 'engine':
+                key, value = order[1:]
+                if key in ship.blocks:
+                    ship.blocks[key].activation_per = value
+
+            elif order[0] == 'action':
+                key, func, args, kwargs, delay, desc = order[1:]
+
+                if not key in api_blocks or not key in ship.blocks:
+                    continue
+
+                # get back the blocks given as argument
+                if any(cls._is_key(arg) and not arg[1] in ship.blocks for arg in args):
+                    continue
+
+                args = [ship.blocks[arg[1]] if cls._is_key(arg) else arg for arg in args]
+                func = getattr(ship.blocks[key], func)
+
+                api_blocks[key]._queue_action(func, *args, delay=delay, desc=desc, **kwargs)
+
+        api._inputs = recorded
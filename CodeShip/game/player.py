@@ -152,11 +152,12 @@ class Player:
         if not remote_control:
             self.handeln_out_ship()
 
-    def display(self):
+    def display(self, alpha=1):
         '''
-        Call Ship's display method
+        Call Ship's display method,
+        `alpha`: the interpolation factor between the last two simulation steps.
         '''
-        self.ship.display()
+        self.ship.display(alpha)
 
     def handeln_out_ship(self):
         '''
@@ -1,7 +1,8 @@
 import pygame
 import numpy as np
 import itertools
-from game.block import Block, Generator, Shield, Turret, Engine
+from collections import OrderedDict
+from game.block import Block, Generator, Shield, Turret, Engine, BlockStates
 from lib.plougame import Interface, Form, Dimension, C
 from lib.perfeval import Counter
 from game.geometry import get_deg, get_rad, get_polar, get_cartesian, get_norm, to_vect
@@ -19,10 +20,16 @@ class Ship:
 
     blocks_priority = ['Generator', 'Engine', 'Shield', 'Turret', 'Block']
 
+    # maximum number of rotated surfaces (and masks) kept in cache
+    ROTATION_CACHE_SIZE = 16
+
     def __init__(self, team, color=None):
         
         self.team = team
 
+        # random generator of the game (see Game.setup_rng)
+        self.rng = np.random.default_rng()
+
         # auxiliar acceleration
         self.is_aux_acc = False
         self.aux_acc = 0
@@ -37,11 +44,24 @@ class Ship:
         self.mass = 0
         self.pos = np.array([0,0], dtype='int32')
 
+        # state of the previous simulation step -> for interpolated display
+        self._prev_pos = None
+        self._prev_orien = None
+
         # blocks
         self.typed_blocks = {'Block':[], 'Generator':[], 'Engine':[], 'Shield':[], 'Turret':[]}
-        self.abs_centers = {}
+        # states of the blocks (hp, power...) indexed by coordinate
+        self.states = BlockStates()
         self._mask = None
 
+        # incremented each time the original surface is modified
+        self._appearance_version = 0
+
+        # rotated surfaces (and masks), key: (version, angle, scale factor)
+        # value: [surface, mask (None until needed)]
+        self._rotation_cache = OrderedDict()
+        self._rotation_key = None
+
         if color:
             self.color = color
 
@@ -182,8 +202,9 @@ class Ship:
         self.has_blocks = True
 
         self.blocks = {}
+        self.states = BlockStates()
         # contains the blocks indexs on corresponding the cases
-        self.blocks_grid = np.zeros(Spec.DIM_SHIP, dtype='int16')
+        self.blocks_grid = np.zeros(Spec.SHAPE_GRID_SHIP, dtype='int16')
         # correspond to the self.blocks indexs -> start at 1
         n_block = 0 
         
@@ -199,6 +220,7 @@ class Ship:
                 # create the blocks
                 block = map_block [ grid[x,y] ] ((x,y), color=self.color)
                 block.ship = self
+                block.set_states(self.states)
 
                 self.blocks[n_block] = block
         
@@ -226,11 +248,18 @@ class Ship:
 
         block.on_death()
 
+        if block.has_shield:
+            for shield in self.typed_blocks['Shield']:
+                shield.on_prtc_block_death(block)
+
         # update mass of ship
         self.mass -= 4
 
         self.typed_blocks[block.name].remove(block)    
-        self.abs_centers.pop(key)
+
+        x, y = block.coord
+        self.blocks_grid[x,y] = 0
+        self.states.clear_cell((x,y))
 
         self.compile()
 
@@ -246,6 +275,7 @@ class Ship:
         surf = block.compile()
 
         self.form.get_surface('original').blit(surf, pos)
+        self._appearance_version += 1
 
     def update_signal(self, block=None, shield=False, index=None):
         '''
@@ -268,6 +298,7 @@ class Ship:
         
         # blit signal surf on form's surface
         signal.display(surface=self.form.get_surface('original'), pos=pos)
+        self._appearance_version += 1
 
     def compile(self):
         '''
@@ -294,6 +325,9 @@ class Ship:
         # create Form object with created surface
         self.form = Form(dim_surf, self.pos, surface=surface)
 
+        self._appearance_version += 1
+        self._rotation_cache.clear()
+
         self.set_signals()
 
         # create first mask
@@ -321,12 +355,39 @@ class Ship:
 
         self.form.rotate(angle)
 
+    def save_state(self):
+        '''
+        Store the position and orientation of the ship,
+        to interpolate the display between two simulation steps.
+        '''
+        self._prev_pos = self.pos.copy()
+        self._prev_orien = self.orien
+
     @Counter.add_func
-    def display(self):
+    def display(self, alpha=1):
         '''
-        Display the ship  
+        Display the ship,  
+        `alpha` is the interpolation factor between the previous (0)
+        and current (1) simulation step (see `save_state`).
         '''
-        self.form.display()
+        if alpha == 1 or self._prev_pos is None:
+            self.form.display()
+            return
+
+        pos = self._prev_pos + alpha * (self.pos - self._prev_pos)
+        orien = self._prev_orien + alpha * (self.orien - self._prev_orien)
+
+        # the form keeps the current simulation step -> used by the collisions
+        _, surface = self._get_rotated_surf(orien)
+
+        # compensate the rotation (as `Form.set_rotated_surface`)
+        dim = self.form.get_dim(scaled=True).astype(int)
+        x1, y1 = pygame.Rect((0,0), dim).center
+        x2, y2 = surface.get_rect().center
+
+        pos = Dimension.scale(pos) - np.array([x2 - x1, y2 - y1])
+
+        self.form.screen.blit(surface, pos.astype(int))
 
     @Counter.add_func
     def run(self, remote_control=False):
@@ -340,8 +401,6 @@ class Ship:
         
         self.form.set_pos(self.pos, scale=True)
 
-        self._compute_blocks_abs_centers()
-
         # update main surface
         self._update_surf()
         
@@ -357,16 +416,59 @@ class Ship:
 
     @Counter.add_func
     def _update_surf(self):
-        self.form.set_surface(surface=self.form.get_surface('original'))
-        self.rotate_surf(self.orien)
+        '''
+        Set the rotated main surface of the ship (see `_get_rotated_surf`).
+        '''
+        self._rotation_key, surface = self._get_rotated_surf(self.orien)
+        self.form.set_rotated_surface(surface)
+
+    def _get_rotated_surf(self, orien):
+        '''
+        Return the cache key and the surface of the ship rotated to `orien`,
+        reuse the cached surface when the ship's appearance and
+        (rounded) orientation are the same as on a previous frame.
+        '''
+        # converts the angle into deg -> rounded for the cache
+        angle = round(-get_deg(orien)) % 360
+
+        key = (self._appearance_version, angle, Dimension.get_factor())
+
+        if key in self._rotation_cache:
+            self._rotation_cache.move_to_end(key)
+            surface = self._rotation_cache[key][0]
+        
+        else:
+            # remove cached surfaces of a previous appearance -> can't be used anymore
+            if len(self._rotation_cache) > 0 and next(reversed(self._rotation_cache))[0] != key[0]:
+                self._rotation_cache.clear()
+
+            dim = self.form.get_dim(scaled=True).astype(int)
+            surface = pygame.transform.scale(self.form.get_surface('original'), dim)
+            surface = pygame.transform.rotate(surface, angle)
+
+            self._rotation_cache[key] = [surface, None]
+
+            if len(self._rotation_cache) > self.ROTATION_CACHE_SIZE:
+                self._rotation_cache.popitem(last=False)
+
+        return key, surface
 
     @Counter.add_func
     def _process_mask(self):
+        entry = self._rotation_cache.get(self._rotation_key)
+
+        if not entry is None and not entry[1] is None:
+            self._mask = entry[1]
+            return
+
         # get white pixels
         self._mask = pygame.mask.from_threshold(self.form.get_surface('main'), C.WHITE, (1,1,1))
         # set mask to other pixels
         self._mask.invert()
 
+        if not entry is None:
+            entry[1] = self._mask
+
     @Counter.add_func
     def update_turrets(self):
         '''
@@ -379,8 +481,7 @@ class Ship:
         '''
         Update all the shields of the ships.
         '''
-        for shield in self.typed_blocks['Shield']:
-            shield.update_state()
+        self.states.regenerate_shields()
 
     def update_state(self):
         '''
@@ -447,22 +548,14 @@ class Ship:
         '''
         Return the sum of the power of all the engines.
         '''
-        force = 0
-        for block in self.typed_blocks['Engine']:
-            force += block.get_engine_force()
-        return force 
+        return Spec.MOTOR_FORCE * self.states.get_engines_activation()
 
     def get_power_level(self):
         '''
         Return the power level of the ship.  
         The power level is the sum of all the power outputs.
         '''
-        power_level = 0
-
-        for block in self.blocks.values():
-            power_level += block.get_power_output()
-        
-        return power_level
+        return self.states.get_power_level()
 
     def control_power_level(self):
         '''
@@ -470,77 +563,57 @@ class Ship:
         If not, deactivate blocks randomly (according to the blocks priority)
         until there is enough power.
         '''
-        power_level = self.get_power_level()
-        
-        if power_level >= 0:
+        if self.get_power_level() >= 0:
             return
         
-        else:
-            # disable blocks until the power level is positive
-            # goes trough every type except the Generator blocks
-            for block_type in self.blocks_priority[:0:-1]:
-                # shuffle the blocks
-                blocks = self.typed_blocks[block_type].copy()
-                np.random.shuffle(blocks)
-
-                for block in blocks:
-                    block.set_activate(False)
-
-                    if self.get_power_level() >= 0:
-                        return
+        # disable blocks until the power level is positive
+        # goes trough every type except the Generator blocks
+        for block_type in self.blocks_priority[:0:-1]:
+            # shuffle the blocks
+            blocks = self.typed_blocks[block_type].copy()
+            self.rng.shuffle(blocks)
+
+            for block in blocks:
+                # the power level is updated by set_activate
+                block.set_activate(False)
+
+                if self.get_power_level() >= 0:
+                    return
     
-    @Counter.add_func
-    def _compute_blocks_abs_centers(self):
+    def get_keys_by_pos(self, positions):
         '''
-        Compute the absolute (scaled) center of all the blocks
+        Given an array of (unscaled) positions,
+        return for each position the key of the block placed at this position,
+        0 if there isn't any block.  
+        The positions are transformed in the ship's frame and then
+        directly looked up in the blocks' grid.
         '''
-        abs_center = np.array(self.form.get_center(scale=False), dtype=float)
-        rel_center = abs_center - self.pos
-
-        for key, block in self.blocks.items():
-            
-            coord = np.array(block.coord, dtype=float)
-            coord *= Spec.SIZE_BLOCK
-            coord += Spec.SIZE_BLOCK // 2
-            coord -= rel_center
-
-            length, alpha = get_polar(coord)
-            
-            alpha += self.orien
+        positions = np.asarray(positions, dtype=float)
+        offsets = positions - self.get_pos(center=True)
 
-            coord = get_cartesian(length, alpha)
+        # rotate of -orien -> position relative to the unrotated ship
+        cos = np.cos(self.orien)
+        sin = np.sin(self.orien)
 
-            coord += rel_center + self.pos
+        x = cos * offsets[:,0] + sin * offsets[:,1] + Spec.DIM_SHIP[0] / 2
+        y = -sin * offsets[:,0] + cos * offsets[:,1] + Spec.DIM_SHIP[1] / 2
 
-            self.abs_centers[key] = coord.astype(int)
+        x = np.floor(x / Spec.SIZE_BLOCK).astype(int)
+        y = np.floor(y / Spec.SIZE_BLOCK).astype(int)
 
-    def get_key_by_pos(self, pos):
-        '''
-        Given a (unscaled) position,
-        return the key of the nearest block.
-        '''
-        distances = {}
-        pos = np.array(pos)
-
-        # compute every distances
-        for key, center in self.abs_centers.items():
-            distances[key] = get_norm(center - pos)
+        inside = (x >= 0) & (x < Spec.SIZE_GRID_SHIP) & (y >= 0) & (y < Spec.SIZE_GRID_SHIP)
 
-        # get key of min distance
-        key = min(distances.keys(), key=distances.get)
+        keys = np.zeros(len(positions), dtype=int)
+        keys[inside] = self.blocks_grid[x[inside], y[inside]]
 
-        return key
+        return keys
 
-    def handeln_collision(self, bullet, intersect):
+    def handeln_collision(self, damage, key):
         '''
-        Handeln collision with a bullet.
+        Handeln collision with a bullet,
+        given its damage and the key of the touched block.
         '''
-        # get coord of touched block
-        key = self.get_key_by_pos(Dimension.inv_scale(intersect))
-
-        self.blocks[key].hit(bullet.damage)
+        self.blocks[key].hit(damage)
         
         if self.blocks[key].hp <= 0:
             self.remove_block(key)
-                
-
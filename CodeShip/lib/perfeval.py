@@ -37,10 +37,6 @@ class Counter:
             r = func(*args, **kwargs)
             
             cls.funcs['time'][index] += time.time() - st
-            
-            if cls.funcs['names'][index] == 'Ship._compute_blocks_abs_centers':
-                if cls.funcs['iterations'][index] == 1:
-                    cls.funcs['time'][index] = 0
 
             return r
         
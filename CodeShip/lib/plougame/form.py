@@ -51,6 +51,7 @@ class Form:
     `set_color`: Set a new color to uni-color surface or font.  
     `on_it`: Return if the mouse is on the Form's surface.  
     `rotate`: Rotate the surface of a given angle.  
+    `set_rotated_surface`: Set an already rotated surface.  
     `compile`: Return a pygame.Surface object of the instance.  
     `get_mask`: Return a pygame.mask.Mask object of the instance.  
     `copy`: Return a copy of the instance.  
@@ -183,14 +184,26 @@ class Form:
     
         new_main = pygame.transform.scale(self._surf['original'], self._sc_dim.astype(int))
 
-        # get none rotated center
-        x1, y1 = new_main.get_rect().center
-
         # rotate surf
-        self._surf['main'] = pygame.transform.rotate(new_main, angle)
+        self.set_rotated_surface(pygame.transform.rotate(new_main, angle))
     
+        if self._surf['font'] and rotate_font:
+            self._surf['font'] = pygame.transform.rotate(pygame.Surface(self._sc_dim.astype(int)), angle)
+            self._surf['font'].fill(self._color)
+
+    def set_rotated_surface(self, surface):
+        '''
+        Set an already scaled & rotated surface as main surface
+        (for example a surface returned by a previous `rotate` call).  
+        The position is compensated for the rotation, as in `rotate`.
+        '''
+        # get none rotated center
+        x1, y1 = pygame.Rect((0,0), self._sc_dim.astype(int)).center
+
+        self._surf['main'] = surface
+
         # get rotated center
-        x2, y2 = self._surf['main'].get_rect().center
+        x2, y2 = surface.get_rect().center
     
         # get deviation between the two centers
         dx = x2 - x1
@@ -201,10 +214,6 @@ class Form:
         # call _set_pos_attr -> it auto compensate the rotation
         # doesn't update unscaled_pos -> keep an anchor point
         self._set_pos_attr(self._sc_pos, update_original=False, compensate_rotation=True)
-    
-        if self._surf['font'] and rotate_font:
-            self._surf['font'] = pygame.transform.rotate(pygame.Surface(self._sc_dim.astype(int)), angle)
-            self._surf['font'].fill(self._color)
 
     def get_mask(self, *, scaled=True, with_marge=False, with_font=False):
         '''
@@ -1,4 +1,4 @@
-import pygame
+import pygame, os
 from pygame.locals import *
 from .form import Form
 from .auxiliary import Dimension, Font, C
@@ -19,10 +19,16 @@ class Interface:
     ---
     `setup`: Initialize the module, create the window  
     `run`: Update the screen, get the inputs for current frame, check for quit events...  
+    `set_fps`: Set the maximum frame rate  
     '''
     clock = pygame.time.Clock()
     running = True
 
+    # maximum frame rate of `run`
+    _fps = Spec.FPS
+
+    _is_headless = False
+
     _gui_objects = [] # all gui objects, ex: button, form...
     _subpages = [] # SubPages instances
     _resize_objects = [] # must have a on_resize(self, factor) method
@@ -32,7 +38,7 @@ class Interface:
 
     @classmethod
     def setup(cls, dim: (int, int), title: str, *, fullscreen=False,
-            background_color=C.WHITE, flags=None, static=False):
+            background_color=C.WHITE, flags=None, static=False, headless=False):
         '''
         Parameters
         ---
@@ -54,6 +60,10 @@ class Interface:
 
         `static`: bool  
         To be implemented.
+
+        `headless`: bool  
+        If True, no window is created (SDL dummy video driver),
+        objects can still be created but nothing is displayed.
         '''
         
         # setup Dimension
@@ -66,6 +76,10 @@ class Interface:
         cls._n_first_frames = Spec.N_FIRST_FRAMES
         cls._is_active_current_frame = True 
 
+        if headless:
+            cls._setup_headless()
+            return
+
         # create screen
         if fullscreen:
             dim = cls._get_screen_dim()
@@ -89,6 +103,34 @@ class Interface:
         # rescale window to correct dim
         cls._rescale(dim)
         
+    @classmethod
+    def _setup_headless(cls):
+        '''
+        Set up the interface without any window,  
+        a 1x1 screen is still created, as pygame needs
+        one to convert the images.
+        '''
+        cls._is_headless = True
+
+        # the video driver can only be changed on a non-initialized display
+        pygame.display.quit()
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        pygame.display.init()
+
+        cls.screen = pygame.display.set_mode((1,1))
+        cls._set_screen(cls.screen)
+
+        Form._interface = cls
+        Form.screen = cls.screen
+
+        # keep the scale factor to 1 -> scaled & unscaled values are the same
+        Dimension.set_factor(1)
+
+    @classmethod
+    def is_headless(cls):
+        '''Return if the Interface has been set up without window'''
+        return cls._is_headless
+
     @classmethod
     def _set_screen(cls, screen):
         '''Set a pygame sreen object'''
@@ -124,6 +166,17 @@ class Interface:
         '''Set the current frame to be displayed'''
         cls._is_active_current_frame = True
 
+    @classmethod
+    def set_fps(cls, fps=None):
+        '''
+        Set the maximum frame rate of `run` (0: no limit),
+        by default: `Spec.FPS`.
+        '''
+        if fps is None:
+            fps = Spec.FPS
+        
+        cls._fps = fps
+
     @classmethod
     def run(cls, fill=True):
         '''
@@ -142,7 +195,7 @@ class Interface:
         Value to give to methods with argument: `events`, 
         obtained with `pygame.event.get`.
         '''
-        cls.clock.tick(Spec.FPS)
+        cls.clock.tick(cls._fps)
 
         pressed = pygame.key.get_pressed()
         events = pygame.event.get()
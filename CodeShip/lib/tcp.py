@@ -1,4 +1,5 @@
-import socket, pickle
+import socket, pickle, struct, hashlib, zlib
+import numpy as np
 from time import sleep
 from lib.console import Console
 
@@ -23,8 +24,16 @@ class ErrorTCP:
 
 
 class Spec:
-    HEADER = 64
+    # header: length of the message, type of message
+    HEADER = struct.Struct('<IB')
+    # types of message
+    TEXT = 0
+    PICKLE = 1
     FORMAT = 'utf-8'
+    # initial size of the receive buffer (grows if needed)
+    BUFSIZE = 4096
+    # maximum size of a decompressed script (bytes)
+    MAX_SCRIPT_SIZE = 2**20
     CONNECT_MSG = b"!CONNECT"
     DISCONNECT_MSG = b"!DISCONNECT"
 
@@ -33,6 +42,65 @@ class Message:
         self.identifier = identifier
         self.content = content
 
+def get_script_hash(script: str) -> str:
+    '''
+    Return the hash of a script (identifies its content).
+    '''
+    return hashlib.sha256(script.encode(Spec.FORMAT)).hexdigest()
+
+def get_grid_hash(grid) -> str:
+    '''
+    Return the hash of a ship grid (identifies its content).
+    '''
+    grid = np.asarray(grid, dtype=np.int64)
+    return hashlib.sha256(str(grid.shape).encode(Spec.FORMAT) + grid.tobytes()).hexdigest()
+
+def pack_script(script: str, known_hash=None) -> list:
+    '''
+    Return the content of a script message: [hash, compressed script].  
+    If the receiver already has the script (`known_hash`),
+    the script is omitted (None).
+    '''
+    script_hash = get_script_hash(script)
+
+    if script_hash == known_hash:
+        return [script_hash, None]
+    
+    return [script_hash, zlib.compress(script.encode(Spec.FORMAT))]
+
+def unpack_script(content) -> tuple:
+    '''
+    Return the hash and the script of a script message,
+    the script is None if it was omitted.  
+    Raise ValueError if the script is invalid, too large (see `Spec.MAX_SCRIPT_SIZE`)
+    or doesn't match the hash.
+    '''
+    script_hash, data = content
+
+    if data is None:
+        return script_hash, None
+
+    # bounded output -> a small message can't be decompressed in a huge script
+    decompressor = zlib.decompressobj()
+
+    try:
+        script = decompressor.decompress(data, Spec.MAX_SCRIPT_SIZE)
+    except (zlib.error, TypeError):
+        raise ValueError("Invalid compressed script.")
+    
+    if len(decompressor.unconsumed_tail) > 0:
+        raise ValueError("Script too large.")
+
+    if not decompressor.eof:
+        raise ValueError("Truncated script.")
+
+    script = script.decode(Spec.FORMAT)
+
+    if get_script_hash(script) != script_hash:
+        raise ValueError("Script doesn't match its hash.")
+
+    return script_hash, script
+
 class ClientTCP:
     '''
     ClientTCP manage the sending and receiving of the messages to a server.
@@ -46,6 +114,7 @@ class ClientTCP:
         - connect : Try to connect to the server.
         - disconnect : Disconnect from the server.
         - send : Send a message to the server.
+        - send_many : Send several messages to the server in a single write.
         - on_message : Method executed when receiving a message, to be implemented.
     '''
 
@@ -58,6 +127,9 @@ class ClientTCP:
 
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
+        # messages are received in the same buffer
+        self._buffer = bytearray(Spec.BUFSIZE)
+
         if connect:
             self.connect()
 
@@ -110,47 +182,89 @@ class ClientTCP:
         '''
         raise NotImplementedError("on_message method must be implemented.")
 
-    def send(self, msg, pickling=False):
+    @staticmethod
+    def _frame(msg, pickling=False) -> bytes:
         '''
-        Send the given message to the client.  
-        If pickling=True, pickle the message.  
-        In case of error: abort operation.  
+        Return the message with its header.  
+        If pickling=True, pickle the message.
         '''
         if pickling:
             message = pickle.dumps(msg)
+            msg_type = Spec.PICKLE
         else:
             message = msg.encode(Spec.FORMAT)
+            msg_type = Spec.TEXT
         
-        # send header
-        length = len(message)
-        msg_length = str(length).encode(Spec.FORMAT)
-        msg_length += b' ' * (Spec.HEADER - len(msg_length))
-        
+        return Spec.HEADER.pack(len(message), msg_type) + message
+
+    def send(self, msg, pickling=False):
+        '''
+        Send the given message to the client.  
+        If pickling=True, pickle the message.  
+        In case of error: abort operation.  
+        '''
+        self.send_many([msg], pickling=pickling)
+
+    def send_many(self, msgs: list, pickling=False):
+        '''
+        Send several messages at once (in a single write).  
+        If pickling=True, pickle the messages.  
+        In case of error: abort operation.  
+        '''
+        data = b''.join(self._frame(msg, pickling=pickling) for msg in msgs)
+
         try:
-            self._socket.send(msg_length)
-            self._socket.send(message)
+            self._socket.sendall(data)
         except:
-            ErrorTCP.call("Failure sending message: " + msg)
+            ErrorTCP.call("Failure sending message.")
+
+    def _receive_into(self, view) -> bool:
+        '''
+        Fill the given view of the buffer with the received bytes.  
+        Return False if the connection is closed.
+        '''
+        while len(view) > 0:
+            size = self._socket.recv_into(view)
+
+            if size == 0:
+                return False
+
+            view = view[size:]
+        
+        return True
 
     def receive(self, decode=True):
         '''
         Wait until receiving a message on own connection.  
-        If decode=True, decode the received msg (`decode` string method).  
+        If decode=True, decode the received msg (`decode` string method),
+        else return a view of the receive buffer (valid until the next call).  
         Message with header, in case of error: abort operation.
         '''
-        msg_length = self._socket.recv(Spec.HEADER).decode(Spec.FORMAT)
-        
-        if msg_length == None or msg_length == '':
-            return
-
         try:
-            msg_length = int(msg_length)
-            msg = self._socket.recv(msg_length)
-        except:
+            header = memoryview(self._buffer)[:Spec.HEADER.size]
+
+            if not self._receive_into(header):
+                ErrorTCP.call("Connection closed by the server.", warning=True)
+                self.connected = False
+                return
+
+            length, _ = Spec.HEADER.unpack(header)
+            
+            if length > len(self._buffer):
+                self._buffer = bytearray(length)
+
+            msg = memoryview(self._buffer)[:length]
+
+            if not self._receive_into(msg):
+                ErrorTCP.call("Connection closed by the server.", warning=True)
+                self.connected = False
+                return
+                
+        except OSError:
             ErrorTCP.call("Failure receiving message.")
             return
         
         if decode:
-            return msg.decode(Spec.FORMAT)
+            return bytes(msg).decode(Spec.FORMAT)
         else:
-            return msg
\ No newline at end of file
+            return msg
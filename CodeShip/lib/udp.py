@@ -1,4 +1,4 @@
-import socket, time
+import socket, select
 
 class ErrorUDP:
     '''
@@ -23,6 +23,8 @@ class ErrorUDP:
 class Spec:
     BUFSIZE = 4096
     DISCONNECT_MSG = b"!DISCONNECT"
+    # maximum time waiting for a message before checking if still running
+    TIMEOUT = 0.5
 
 
 class ClientUDP:
@@ -37,6 +39,9 @@ class ClientUDP:
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._socket.bind(('',0))
 
+        # messages are received in the same buffer
+        self._buffer = bytearray(Spec.BUFSIZE)
+
     def get_local_port(self):
         '''
         Get the port on which the socket listen for messages
@@ -49,8 +54,6 @@ class ClientUDP:
         If `addr` is not specified: take default address.  
         In case of error: abort operation.  
         '''
-        msg += b' ' * (Spec.BUFSIZE - len(msg))
-
         if addr == None:
             addr = self.addr
 
@@ -59,18 +62,25 @@ class ClientUDP:
     def run(self):
         '''
         Loop that wait for all messages.  
-        Execute on_message method.  
+        Execute on_message method,
+        the message is a view of the receive buffer:
+        only valid until the method returns.  
         To end execution, call disconnect method.  
         '''
+        buffer = memoryview(self._buffer)
 
         while self.running:
 
-            time.sleep(0.01)
+            readable, _, _ = select.select([self._socket], [], [], Spec.TIMEOUT)
+
+            if len(readable) == 0:
+                continue
 
             # receive msg
-            msg, address = self._socket.recvfrom(Spec.BUFSIZE)
+            size, address = self._socket.recvfrom_into(self._buffer)
+            msg = buffer[:size]
             
-            if Spec.DISCONNECT_MSG in msg:
+            if msg == Spec.DISCONNECT_MSG:
                 break
             
             self.on_message(msg)
@@ -0,0 +1,71 @@
+'''
+Simulate games between the local script and a bot,
+without any window nor frame cap.
+
+Usage: `$ python3 simulate.py [-n n_games] [-f max_frames] [-b botname] [-s seed]`
+The ship used by the script is the one of the active account (on local),
+if there isn't any, it uses the ship of the bot.
+'''
+import argparse, json, os, time
+import numpy as np
+from lib.plougame import Interface, C
+
+parser = argparse.ArgumentParser(description="Simulate games against a bot.")
+parser.add_argument('-n', type=int, default=1, help="number of games")
+parser.add_argument('-f', type=int, default=None, help="maximum number of frames per game")
+parser.add_argument('-b', type=str, default='bot1', help="name of the bot")
+parser.add_argument('-s', type=int, default=None, help="seed of the random generator")
+args = parser.parse_args()
+
+# setup the interface without window -> to create Form objects
+Interface.setup((3200,1800), 'CodeShip', background_color=C.WHITE, headless=True)
+
+from game.game import Game
+from comm.uiclient import UIClient
+from data.spec import Spec
+
+# get the ship of the script
+username = Spec.JSON_DATA['active account']
+data = None
+
+if not username is None:
+    data = Spec.load_user_data(username)
+
+if data is None:
+    with open(os.path.join('game', 'bots', f'{args.b}.json'), 'r') as file:
+        data = json.load(file)
+
+grid = np.array(data['ship'])
+
+# the client is never connected, only used to read the game's data
+client = UIClient((Spec.IP_HOST1, Spec.PORT))
+game = Game(client, connected=False, headless=True)
+
+results = {'win': 0, 'loss': 0, 'draw': 0}
+total_frames = 0
+total_time = 0
+
+for i in range(args.n):
+
+    # one seed per game, derived from the given seed
+    seed = None if args.s is None else [args.s, i]
+    game.setup_with_bot(1, grid, 'Script', botname=args.b, seed=seed)
+
+    st = time.time()
+    n_frame = game.simulate(max_frames=args.f)
+    duration = time.time() - st
+
+    total_frames += n_frame
+    total_time += duration
+
+    if game.end_state is None:
+        results['draw'] += 1
+        cause = "Maximum number of frames reached."
+    else:
+        has_win, cause = game.end_state
+        results['win' if has_win else 'loss'] += 1
+
+    print(f'Game {i+1}: {n_frame} frames, {n_frame/duration:.0f} fps | {cause}')
+
+print(f"\nWins: {results['win']}   Losses: {results['loss']}   Draws: {results['draw']}")
+print(f'Mean performance: {total_frames/total_time:.0f} fps')
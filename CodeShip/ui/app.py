@@ -8,7 +8,7 @@ from ui import (Connection,
                 Offline)
 
 from data.spec import Spec
-import time, numpy as np
+import numpy as np
 
 class App(Application):
 
@@ -242,24 +242,22 @@ class App(Application):
         '''
         Check if the user is entering in a game
         '''
-        # look for notification
-        with self.client.get_data('ign') as contents:
+        # the opp's grid never came -> don't wait forever
+        if self.client.is_game_setup_expired():
+            self.client.abort_game_setup()
+            self.get_page(Spec.PAGE_MENU).reset_play()
+            return
 
-            if contents == None:
-                return
+        # look for notification, wait until the opp's grid is received
+        if not self.client.is_game_ready():
+            return
+
+        with self.client.get_data(['ign', 'igsh']) as (contents, opp_grid):
             
-            username, team = contents
+            username, team, token, seed, _ = contents
             self.in_game = True
             self.opponent = username
         
-        # wait to be sure to receive every info
-        time.sleep(.1)
-
-        # if notified -> get opp's grid
-        with self.client.get_data('igsh') as grid:
-
-            opp_grid = grid
-        
         own_grid = self.client.in_data['sh']
         
         # load & store script
@@ -269,7 +267,7 @@ class App(Application):
             file.write(script)
         
         # set game
-        self.game.setup(int(team), own_grid, opp_grid, self.username, self.opponent)
+        self.game.setup(int(team), own_grid, opp_grid, self.username, self.opponent, token=token, seed=seed)
     
         # go to the menu
         self.change_page(Spec.PAGE_MENU)
@@ -283,16 +281,19 @@ class App(Application):
         Check if receiving profil data.
         '''
 
+        page_profil = self.get_page(Spec.PAGE_PROFIL)
+
         with self.client.get_data('rpd') as content:
 
-            if content == None:
-                return
-            
-            page_profil = self.get_page(Spec.PAGE_PROFIL)
+            if not content is None:
+                page_profil.setup_page(**content)
+                self.change_page(Spec.PAGE_PROFIL)
 
-            page_profil.setup_page(**content)
+        # rank of the user (received after the profil data)
+        with self.client.get_data('rlb') as content:
 
-            self.change_page(Spec.PAGE_PROFIL)
+            if not content is None:
+                page_profil.set_rank(content['username'], content['rank'], content['n_users'])
 
     def display(self):
         self.version.display()
@@ -80,6 +80,12 @@ text_loss = TextBox(DIM_CASE, POS_TABLE + DY + 2*DX, text_color=C.DARK_RED,
 text_ratio = TextBox(DIM_CASE, POS_TABLE + DY + 3*DX,
                 marge=True, font=Font.f(55))
 
+title_rank = TextBox(DIM_CASE, POS_TABLE + 2*DY, text='Rank', 
+                marge=True, font=Font.f(45))
+
+text_rank = TextBox(DIM_CASE, POS_TABLE + 2*DY + DX,
+                marge=True, font=Font.f(55))
+
 title_scroll = TextBox(Spec.DIM_BIG_TEXT, POS_TITLE_SCR, text='Friends', font=Font.f(50))
 
 scroll_friends = ScrollList(DIM_SCR_FRS, POS_SCR_FRS, [])
@@ -103,6 +109,8 @@ components = [
     ('t wins', text_wins),
     ('t loss', text_loss),
     ('t ratio', text_ratio),
+    ('ti rank', title_rank),
+    ('t rank', text_rank),
     ('ti scr', title_scroll),
     ('s frs', scroll_friends),
     ('t rdfr', text_rdfr)
@@ -214,6 +222,7 @@ class Profil(Page):
             ratio = wins/loss
 
         self.set_text('t ratio', f'{ratio:.2f}')
+        self.set_text('t rank', '-')
 
         scroll = self.get_component('s frs')
         scroll.clear()
@@ -226,6 +235,18 @@ class Profil(Page):
         self.setup_ship(grid)
         self.unreads[username] = 0
 
+    def set_rank(self, username, rank, n_users):
+        '''
+        Set the rank of the user in the leaderboard
+        '''
+        if username != self.target:
+            return
+
+        if rank is None:
+            self.set_text('t rank', '-')
+        else:
+            self.set_text('t rank', f'{rank}/{n_users}')
+
     def setup_ship(self, grid):
         '''
         Create the ship surface
@@ -1,57 +1,279 @@
 import numpy as np
-import json, os
+import json, os, sqlite3, threading
+from collections import OrderedDict
+from db.leaderboard import Leaderboard
 from spec import Spec
 
 class DataBase:
+    '''
+    Static object.
 
-    usernames: list
-    data: dict
+    Store the data of the users in a sqlite database (WAL mode).  
+    The users are loaded on demand in a bounded cache (LRU),
+    the modified users are periodically written back by a background thread.  
+    NOTE: the leaderboard (see `Leaderboard`) is built at startup from the
+    wins/loss of every user: the whole users table is read once
+    and the index stays in memory (a few values per user).
+    '''
+
+    conn: sqlite3.Connection
+
+    # loaded users, key: username (least recently used first)
+    _users = OrderedDict()
+    # usernames of the modified users, not yet written
+    _dirty = set()
+
+    # the database is used by the tcp server & the flusher thread
+    _lock = threading.RLock()
+    _stop_flusher = threading.Event()
 
     @classmethod
     def load(cls):
         '''
-        Load data of users.
+        Open the database, create the tables if needed.  
+        Import the users stored in the old .json files (if not done yet).  
+        Build the leaderboard (reads the wins/loss of every user).
         '''
-        # load usernames
-        with open(os.path.join('db','data','users.json'), 'r') as file:
-            data = json.load(file)
-        
-        cls.usernames = data['usernames']
-        cls.data = {} # key: username
+        cls.conn = sqlite3.connect(os.path.join('db','data',Spec.DB_FILENAME), check_same_thread=False)
+
+        # WAL: a commit only appends to the log (no rewrite of the database)
+        cls.conn.execute('PRAGMA journal_mode=WAL')
+        cls.conn.execute('PRAGMA synchronous=NORMAL')
+
+        with cls.conn:
+            cls.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    password TEXT NOT NULL,
+                    script_status INTEGER NOT NULL DEFAULT 0,
+                    ship_status INTEGER NOT NULL DEFAULT 0,
+                    wins INTEGER NOT NULL DEFAULT 0,
+                    loss INTEGER NOT NULL DEFAULT 0,
+                    ship TEXT NOT NULL,
+                    script TEXT NOT NULL DEFAULT ''
+                );
+                CREATE TABLE IF NOT EXISTS friends (
+                    username TEXT NOT NULL,
+                    friend TEXT NOT NULL,
+                    PRIMARY KEY (username, friend)
+                );
+                CREATE TABLE IF NOT EXISTS friend_demands (
+                    target TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    PRIMARY KEY (target, sender)
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            ''')
+
+        cls._import_json()
+
+        Leaderboard.load(cls.conn.execute('SELECT username, wins, loss FROM users'))
+
+        cls._stop_flusher.clear()
+        threading.Thread(target=cls._run_flusher, daemon=True).start()
+
+    @classmethod
+    def _import_json(cls):
+        '''
+        Import the users stored in the .json files (old storage),
+        the users already in the database are ignored.  
+        Done once: the import is marked in the meta table.
+        '''
+        filename = os.path.join('db','data','users.json')
+
+        if not os.path.exists(filename):
+            return
+
+        row = cls.conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+
+        if not row is None:
+            return
+
+        with open(filename, 'r') as file:
+            usernames = json.load(file)['usernames']
+
+        with cls.conn:
+            for username in usernames:
+
+                if cls.is_user(username):
+                    continue
+
+                with open(os.path.join('db','data','users',f'{username}.json'), 'r') as file:
+                    data = json.load(file)
 
-        # load user's data
-        for username in cls.usernames:
+                script = data['script']
+                if type(script) == list:
+                    script = '\n'.join(script)
 
-            with open(os.path.join('db','data','users',f'{username}.json'), 'r') as file:
-                cls.data[username] = json.load(file)
+                cls.conn.execute(
+                    'INSERT INTO users VALUES (?,?,?,?,?,?,?,?)',
+                    (username, data['password'], data['script status'], data['ship status'],
+                    data['wins'], data['loss'], json.dumps(data['ship']), script)
+                )
+                cls.conn.executemany('INSERT OR IGNORE INTO friends VALUES (?,?)',
+                    [(username, friend) for friend in data['friends']])
+                cls.conn.executemany('INSERT OR IGNORE INTO friend_demands VALUES (?,?)',
+                    [(username, sender) for sender in data['dfr']])
 
-            # convert ship list to array
-            cls.data[username]['ship'] = np.array(cls.data[username]['ship'], int)
+            cls.conn.execute("INSERT INTO meta VALUES ('json_imported', '1')")
 
     @classmethod
     def store(cls):
         '''
-        Store the data
+        Write the modified users, close the database.
         '''
-        # store usernames
-        with open(os.path.join('db','data','users.json'), 'w') as file:
-            json.dump({"usernames": cls.usernames}, file, indent=4)
+        cls._stop_flusher.set()
+        cls.flush()
 
-        # load user's data
-        for username in cls.usernames:
+        with cls._lock:
+            cls.conn.close()
 
-            # convert numpy array to a list -> json can't handeln np.ndarray
-            cls.data[username]['ship'] = cls.data[username]['ship'].tolist()
+    @classmethod
+    def _run_flusher(cls):
+        '''
+        Periodically write the modified users (write-behind).
+        '''
+        while not cls._stop_flusher.wait(Spec.DB_FLUSH_PERIOD):
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        '''
+        Write the modified users in a single transaction.
+        '''
+        with cls._lock:
+
+            if len(cls._dirty) == 0:
+                return
+
+            with cls.conn:
+                for username in cls._dirty:
+                    cls._write_user(username, cls._users[username])
+            
+            cls._dirty.clear()
+
+    @classmethod
+    def _write_user(cls, username, user):
+        '''
+        Write the data of a user (must be in a transaction).
+        '''
+        cls.conn.execute(
+            '''UPDATE users SET script_status = ?, ship_status = ?, wins = ?, loss = ?,
+            ship = ?, script = ? WHERE username = ?''',
+            (user['script_status'], user['ship_status'], user['wins'], user['loss'],
+            json.dumps(user['ship'].tolist()), '\n'.join(user['script']), username)
+        )
 
-            with open(os.path.join('db','data','users',f'{username}.json'), 'w') as file:
-                json.dump(cls.data[username], file, indent=4)
+        cls.conn.execute('DELETE FROM friends WHERE username = ?', (username,))
+        cls.conn.executemany('INSERT INTO friends VALUES (?,?)',
+            [(username, friend) for friend in user['friends']])
+        
+        cls.conn.execute('DELETE FROM friend_demands WHERE target = ?', (username,))
+        cls.conn.executemany('INSERT INTO friend_demands VALUES (?,?)',
+            [(username, sender) for sender in user['dfr']])
+
+    @classmethod
+    def _read_user(cls, username):
+        '''
+        Read the data of a user,
+        raise KeyError if the user doesn't exist.
+        '''
+        row = cls.conn.execute(
+            '''SELECT password, script_status, ship_status, wins, loss, ship, script
+            FROM users WHERE username = ?''', (username,)
+        ).fetchone()
+
+        if row is None:
+            raise KeyError(username)
+
+        friends = cls.conn.execute(
+            'SELECT friend FROM friends WHERE username = ?', (username,)
+        ).fetchall()
+
+        dfr = cls.conn.execute(
+            'SELECT sender FROM friend_demands WHERE target = ?', (username,)
+        ).fetchall()
+
+        return {
+            'password': row[0],
+            'script_status': row[1],
+            'ship_status': row[2],
+            'wins': row[3],
+            'loss': row[4],
+            'ship': np.array(json.loads(row[5]), dtype=int),
+            'script': row[6].split('\n'),
+            'friends': [friend for friend, in friends],
+            'dfr': [sender for sender, in dfr],
+        }
+
+    @classmethod
+    def _get_user(cls, username):
+        '''
+        Return the data of a user, load it if needed.  
+        The least recently used users are removed from the cache
+        (written if modified).
+        '''
+        if username in cls._users:
+            cls._users.move_to_end(username)
+            return cls._users[username]
+
+        user = cls._read_user(username)
+        cls._users[username] = user
+
+        while len(cls._users) > Spec.DB_CACHE_SIZE:
+            old_username, old_user = cls._users.popitem(last=False)
+
+            if old_username in cls._dirty:
+                with cls.conn:
+                    cls._write_user(old_username, old_user)
+                cls._dirty.remove(old_username)
+
+        return user
+
+    @classmethod
+    def _get(cls, username, key):
+        '''
+        Return a value of a user.
+        '''
+        with cls._lock:
+            return cls._get_user(username)[key]
+
+    @classmethod
+    def _set(cls, username, key, value):
+        '''
+        Set a value of a user, mark the user as modified.
+        '''
+        with cls._lock:
+            cls._get_user(username)[key] = value
+            cls._dirty.add(username)
+
+    @classmethod
+    def _update_leaderboard(cls, username):
+        '''
+        Set the wins/loss of a user in the leaderboard.
+        '''
+        with cls._lock:
+            user = cls._get_user(username)
+            Leaderboard.update(username, user['wins'], user['loss'])
 
     @classmethod
     def is_user(cls, username):
         '''
         Return if the given user exist in the database.
         '''
-        return username in cls.usernames
+        with cls._lock:
+
+            if username in cls._users:
+                return True
+
+            row = cls.conn.execute(
+                'SELECT 1 FROM users WHERE username = ?', (username,)
+            ).fetchone()
+
+        return not row is None
 
     @classmethod
     def add_user(cls, username, password):
@@ -59,162 +281,177 @@ class DataBase:
         Try to add a new user to the dataframe.  
         Return if the username could be added.
         '''
-        if cls.is_user(username):
+        ship = np.zeros(Spec.SHIP_GRID_SHAPE, dtype=int)
+
+        try:
+            with cls._lock, cls.conn:
+                cls.conn.execute(
+                    'INSERT INTO users (username, password, ship) VALUES (?,?,?)',
+                    (username, password, json.dumps(ship.tolist()))
+                )
+        except sqlite3.IntegrityError:
             return False
-        
-        cls.usernames.append(username)
-
-        cls.data[username] = {
-            "password": password,
-            "friends": [],
-            "dfr": [],
-            "script status": 0,
-            "ship status": 0,
-            "wins": 0,
-            "loss": 0,
-            "ship": np.zeros(Spec.SHIP_GRID_SHAPE, dtype=int),
-            "script": ""
-        }
+
+        Leaderboard.update(username, 0, 0)
+        return True
 
     @classmethod
     def get_ship(cls, username):
         '''
         Return the ship array of a user
         '''
-        return cls.data[username]['ship']
+        return cls._get(username, 'ship').copy()
 
     @classmethod
     def set_ship(cls, username, grid):
         '''
         Set the ship grid of a user
         '''
-        cls.data[username]['ship'] = grid
+        cls._set(username, 'ship', np.array(grid, dtype=int))
 
     @classmethod
     def set_script(cls, username, script):
         '''
         Set the script of a user
         '''
-        cls.data[username]['script'] = script
+        cls._set(username, 'script', list(script))
 
     @classmethod
     def get_script(cls, username):
         '''
         Return the script of a user
         '''
-        return cls.data[username]['script']
+        return list(cls._get(username, 'script'))
 
     @classmethod
     def set_script_status(cls, username, script_status):
         '''
         Set the script status of a user
         '''
-        cls.data[username]['script status'] = int(script_status)
+        cls._set(username, 'script_status', int(script_status))
 
     @classmethod
     def get_script_status(cls, username):
         '''
         Return the script status of a user
         '''
-        return cls.data[username]['script status']
+        return cls._get(username, 'script_status')
 
     @classmethod
     def set_ship_status(cls, username, ship_status):
         '''
         Set the ship status of a user
         '''
-        cls.data[username]['ship status'] = int(ship_status)
+        cls._set(username, 'ship_status', int(ship_status))
 
     @classmethod
     def get_ship_status(cls, username):
         '''
         Return the ship status of a user
         '''
-        return cls.data[username]['ship status']
+        return cls._get(username, 'ship_status')
 
     @classmethod
     def get_password(cls, username):
         '''
         Return the password of the given username.
         '''
-        return cls.data[username]['password']
-    
+        return cls._get(username, 'password')
+
     @classmethod
     def get_friends(cls, username):
         '''
         Return the friends of the given username.
         '''
-        return cls.data[username]['friends']
-    
+        return list(cls._get(username, 'friends'))
+
     @classmethod
     def set_as_friends(cls, user1, user2):
         '''
         Set two users to be friends.
         '''
-        cls.data[user1]['friends'].append(user2)
-        cls.data[user2]['friends'].append(user1)
+        with cls._lock:
+            for user, friend in ((user1, user2), (user2, user1)):
+                friends = cls._get(user, 'friends')
+
+                if not friend in friends:
+                    cls._set(user, 'friends', friends + [friend])
 
     @classmethod
     def get_friend_demands(cls, username):
         '''
         Return the friend demands of the given username.
         '''
-        return cls.data[username]['dfr']
+        return list(cls._get(username, 'dfr'))
 
     @classmethod
     def add_friend_demand(cls, target, sender):
         '''
         Store the friend demand, for in the case the user isn't connected yet.
         '''
-        if not sender in cls.data[target]['dfr']:
-            cls.data[target]['dfr'].append(sender)
-    
+        with cls._lock:
+            dfr = cls._get(target, 'dfr')
+
+            if not sender in dfr:
+                cls._set(target, 'dfr', dfr + [sender])
+
     @classmethod
     def remove_friend_demand(cls, target, sender):
         '''
         Remove a friend demand.
         '''
-        if sender in cls.data[target]['dfr']:
-            cls.data[target]['dfr'].remove(sender)
-    
+        with cls._lock:
+            dfr = cls._get(target, 'dfr')
+
+            if sender in dfr:
+                cls._set(target, 'dfr', [user for user in dfr if user != sender])
+
     @classmethod
     def set_wins(cls, username, wins):
         '''
         Set the wins of a user
         '''
-        cls.data[username]['wins'] = int(wins)
+        with cls._lock:
+            cls._set(username, 'wins', int(wins))
+            cls._update_leaderboard(username)
 
     @classmethod
     def get_wins(cls, username):
         '''
         Return the wins of a user
         '''
-        return cls.data[username]['wins']
-    
+        return cls._get(username, 'wins')
+
     @classmethod
     def increment_wins(cls, username, step=1):
         '''
         Increment by `step` the number of wins of the user.
         '''
-        cls.data[username]['wins'] += step
+        with cls._lock:
+            cls._set(username, 'wins', cls._get(username, 'wins') + step)
+            cls._update_leaderboard(username)
 
     @classmethod
     def set_loss(cls, username, loss):
         '''
         Set the loss of a user
         '''
-        cls.data[username]['loss'] = int(loss)
+        with cls._lock:
+            cls._set(username, 'loss', int(loss))
+            cls._update_leaderboard(username)
 
     @classmethod
     def get_loss(cls, username):
         '''
         Return the loss of a user
         '''
-        return cls.data[username]['loss']
-    
+        return cls._get(username, 'loss')
+
     @classmethod
     def increment_loss(cls, username, step=1):
         '''
         Increment by `step` the number of loss of the user.
         '''
-        cls.data[username]['loss'] += step
+        with cls._lock:
+            cls._set(username, 'loss', cls._get(username, 'loss') + step)
+            cls._update_leaderboard(username)
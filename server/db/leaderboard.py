@@ -0,0 +1,310 @@
+import random
+
+class _Node:
+
+    __slots__ = ('key', 'next', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # number of keys passed by each link
+        self.span = [0] * level
+
+class RankIndex:
+    '''
+    Ordered index of keys (skip list).
+    Each link stores the number of keys it passes,
+    which gives the rank of a key in O(log n).
+    '''
+
+    MAX_LEVEL = 32
+    # probability to go up of a level
+    P = 0.25
+
+    def __init__(self, keys=()):
+        self._head = _Node(None, self.MAX_LEVEL)
+        self._level = 1
+        self._len = 0
+
+        # own generator -> doesn't modify the global random state
+        self._random = random.Random(0)
+
+        self._build(sorted(keys))
+
+    def _build(self, keys):
+        '''
+        Fill the empty index with the given sorted keys, in O(n).
+        '''
+        # last node of each level, and its rank
+        tails = [self._head] * self.MAX_LEVEL
+        ranks = [0] * self.MAX_LEVEL
+
+        for rank, key in enumerate(keys, 1):
+            level = self._get_random_level()
+            node = _Node(key, level)
+
+            for i in range(level):
+                tails[i].next[i] = node
+                tails[i].span[i] = rank - ranks[i]
+                tails[i] = node
+                ranks[i] = rank
+
+            self._level = max(self._level, level)
+
+        self._len = len(keys)
+
+        for i in range(self._level):
+            tails[i].span[i] = self._len - ranks[i]
+
+    def __len__(self):
+        return self._len
+
+    def _get_random_level(self):
+        '''
+        Return the level of a new node.
+        '''
+        level = 1
+
+        while level < self.MAX_LEVEL and self._random.random() < self.P:
+            level += 1
+
+        return level
+
+    def insert(self, key):
+        '''
+        Insert a key in the index.
+        '''
+        # last node before the key on each level, and its rank
+        update = [None] * self.MAX_LEVEL
+        ranks = [0] * self.MAX_LEVEL
+        node = self._head
+
+        for i in reversed(range(self._level)):
+
+            if i < self._level - 1:
+                ranks[i] = ranks[i+1]
+
+            while not node.next[i] is None and node.next[i].key < key:
+                ranks[i] += node.span[i]
+                node = node.next[i]
+
+            update[i] = node
+
+        level = self._get_random_level()
+
+        if level > self._level:
+            for i in range(self._level, level):
+                update[i] = self._head
+                update[i].span[i] = self._len
+
+            self._level = level
+
+        new = _Node(key, level)
+
+        for i in range(level):
+            new.next[i] = update[i].next[i]
+            update[i].next[i] = new
+
+            new.span[i] = update[i].span[i] - (ranks[0] - ranks[i])
+            update[i].span[i] = ranks[0] - ranks[i] + 1
+
+        # the links above the new node pass one more key
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+
+        self._len += 1
+
+    def remove(self, key):
+        '''
+        Remove a key of the index,
+        raise KeyError if it isn't in the index.
+        '''
+        update = [None] * self.MAX_LEVEL
+        node = self._head
+
+        for i in reversed(range(self._level)):
+
+            while not node.next[i] is None and node.next[i].key < key:
+                node = node.next[i]
+
+            update[i] = node
+
+        node = node.next[0]
+
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        for i in range(self._level):
+
+            if update[i].next[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].next[i] = node.next[i]
+            else:
+                update[i].span[i] -= 1
+
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+
+        self._len -= 1
+
+    def get_rank(self, key):
+        '''
+        Return the rank of a key (0: first key),
+        None if it isn't in the index.
+        '''
+        rank = 0
+        node = self._head
+
+        for i in reversed(range(self._level)):
+
+            while not node.next[i] is None and node.next[i].key <= key:
+                rank += node.span[i]
+                node = node.next[i]
+
+            if not node is self._head and node.key == key:
+                return rank - 1
+
+        return None
+
+    def get_range(self, start, stop):
+        '''
+        Return the keys from the rank `start` to `stop` (excluded).
+        '''
+        start = max(start, 0)
+        stop = min(stop, self._len)
+
+        if start >= stop:
+            return []
+
+        # go to the key of rank `start`
+        passed = 0
+        node = self._head
+
+        for i in reversed(range(self._level)):
+
+            while not node.next[i] is None and passed + node.span[i] <= start + 1:
+                passed += node.span[i]
+                node = node.next[i]
+
+        keys = []
+
+        for _ in range(stop - start):
+            keys.append(node.key)
+            node = node.next[0]
+
+        return keys
+
+class Leaderboard:
+    '''
+    Static object.
+
+    Ranking of the users: by wins, then by win rate.
+    The users are kept in an ordered index (`RankIndex`),
+    updated on each change of the wins/loss of a user.
+
+    Methods
+    ---
+    `load`: Build the index given the wins/loss of every user
+    `update`: Set the wins/loss of a user
+    `get_n_users`: Return the number of ranked users
+    `get_rank`: Return the rank of a user
+    `get_top`: Return the first users
+    `get_around`: Return the users around a user
+    '''
+
+    _index = RankIndex()
+    # key of each user in the index, key: username
+    _keys = {}
+
+    @staticmethod
+    def _get_key(username, wins, loss):
+        '''
+        Return the key of a user in the index (smaller key: better rank).
+        '''
+        games = wins + loss
+
+        if games == 0:
+            rate = 0
+        else:
+            rate = wins / games
+
+        return (-wins, -rate, username)
+
+    @classmethod
+    def load(cls, users):
+        '''
+        Build the index,
+        `users`: iterable of (username, wins, loss)  
+        Every user is ranked -> all of them are given (read once at startup).
+        '''
+        cls._keys = {username: cls._get_key(username, wins, loss)
+            for username, wins, loss in users}
+        
+        cls._index = RankIndex(cls._keys.values())
+
+    @classmethod
+    def update(cls, username, wins, loss):
+        '''
+        Set the wins/loss of a user (add it if needed).
+        '''
+        key = cls._get_key(username, wins, loss)
+        old_key = cls._keys.get(username)
+
+        if key == old_key:
+            return
+
+        if not old_key is None:
+            cls._index.remove(old_key)
+
+        cls._index.insert(key)
+        cls._keys[username] = key
+
+    @classmethod
+    def get_n_users(cls):
+        '''
+        Return the number of ranked users.
+        '''
+        return len(cls._index)
+
+    @classmethod
+    def get_rank(cls, username):
+        '''
+        Return the rank of a user (1: first), None if not ranked.
+        '''
+        if not username in cls._keys:
+            return None
+
+        return cls._index.get_rank(cls._keys[username]) + 1
+
+    @classmethod
+    def _get_entries(cls, start, stop):
+        '''
+        Return the entries (rank, username, wins, win rate)
+        from the rank `start` to `stop` (excluded, 0: first).
+        '''
+        keys = cls._index.get_range(start, stop)
+        start = max(start, 0)
+
+        return [(start + i + 1, username, -wins, -rate)
+            for i, (wins, rate, username) in enumerate(keys)]
+
+    @classmethod
+    def get_top(cls, n):
+        '''
+        Return the entries of the `n` first users,
+        entry: (rank, username, wins, win rate)
+        '''
+        return cls._get_entries(0, n)
+
+    @classmethod
+    def get_around(cls, username, n):
+        '''
+        Return the entries of the user and of the `n` users before & after it,
+        entry: (rank, username, wins, win rate)
+        '''
+        rank = cls.get_rank(username)
+
+        if rank is None:
+            return []
+
+        return cls._get_entries(rank - 1 - n, rank + n)
@@ -1,6 +1,6 @@
-import socket, threading, pickle
+import asyncio, pickle, struct, hashlib, zlib
+import numpy as np
 from lib.console import Console
-from time import time, sleep
 
 class ErrorServer:
 
@@ -19,19 +19,90 @@ class ErrorServer:
 
 
 class Spec:
-    HEADER = 64
+    # header: length of the message, type of message
+    HEADER = struct.Struct('<IB')
+    # types of message
+    TEXT = 0
+    PICKLE = 1
     FORMAT = 'utf-8'
+    # maximum size of a received message (bytes)
+    MAX_MSG_SIZE = 2**20
+    # maximum size of a decompressed script (bytes)
+    MAX_SCRIPT_SIZE = 2**20
     CONNECT_MSG = b"!CONNECT"
     DISCONNECT_MSG = b"!DISCONNECT"
+    # maximum size of the messages waiting to be sent to a client (bytes),
+    # above: the client is too slow -> disconnected
+    MAX_WRITE_BUFFER = 2**22
 
 class Message:
     def __init__(self, identifier, content):
         self.identifier = identifier
         self.content = content
 
+def get_script_hash(script: str) -> str:
+    '''
+    Return the hash of a script (identifies its content).
+    '''
+    return hashlib.sha256(script.encode(Spec.FORMAT)).hexdigest()
+
+def get_grid_hash(grid) -> str:
+    '''
+    Return the hash of a ship grid (identifies its content).
+    '''
+    grid = np.asarray(grid, dtype=np.int64)
+    return hashlib.sha256(str(grid.shape).encode(Spec.FORMAT) + grid.tobytes()).hexdigest()
+
+def pack_script(script: str, known_hash=None) -> list:
+    '''
+    Return the content of a script message: [hash, compressed script].  
+    If the receiver already has the script (`known_hash`),
+    the script is omitted (None).
+    '''
+    script_hash = get_script_hash(script)
+
+    if script_hash == known_hash:
+        return [script_hash, None]
+    
+    return [script_hash, zlib.compress(script.encode(Spec.FORMAT))]
+
+def unpack_script(content) -> tuple:
+    '''
+    Return the hash and the script of a script message,
+    the script is None if it was omitted.  
+    Raise ValueError if the script is invalid, too large (see `Spec.MAX_SCRIPT_SIZE`)
+    or doesn't match the hash.
+    '''
+    script_hash, data = content
+
+    if data is None:
+        return script_hash, None
+
+    # bounded output -> a small message can't be decompressed in a huge script
+    decompressor = zlib.decompressobj()
+
+    try:
+        script = decompressor.decompress(data, Spec.MAX_SCRIPT_SIZE)
+    except (zlib.error, TypeError):
+        raise ValueError("Invalid compressed script.")
+    
+    if len(decompressor.unconsumed_tail) > 0:
+        raise ValueError("Script too large.")
+
+    if not decompressor.eof:
+        raise ValueError("Truncated script.")
+
+    script = script.decode(Spec.FORMAT)
+
+    if get_script_hash(script) != script_hash:
+        raise ValueError("Script doesn't match its hash.")
+
+    return script_hash, script
+
 class ServerTCP:
     '''
-    ServerTCP wrap the socket.socket object. It works with the ClientTCP object.  
+    ServerTCP wrap an asyncio server. It works with the ClientTCP object.  
+    All the connections are handled in a single event loop.
     
     Arguments:
         - port : port from wich the connections will reach the server.
@@ -45,51 +116,56 @@ class ServerTCP:
     def __init__(self, port, ip=None):
 
         if ip == None:
-            self._ip = ''
+            self._ip = None
         else:
             self._ip = ip
 
         self._port = port
         self._addr = (self._ip, self._port)
-        self._running = True
-
-        # create socket with TCP protocol
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.bind()
-        self._socket.listen()
+        self._server = None
 
-    def bind(self):
+    async def bind(self):
         '''
         Bind the server to the given port & potential ip address.  
         In case of error: abort operation.
         '''
-
         try:
-            self._socket.bind(self._addr)
-        except:
+            self._server = await asyncio.start_server(self._on_connection, self._ip, self._port)
+        except OSError:
             ErrorServer.call("Port already used.")
             quit()
-        
+
     def run(self):
         '''
         Loop that wait for connections.  
         Execute on_connection method.  
-        To end execution, set running attribute to False.
         '''
+        asyncio.run(self._run())
 
-        while self._running:
+    async def _run(self):
 
-            conn, addr = self._socket.accept()
+        await self.bind()
 
-            Console.print(f'[TCP] |{addr[0]}| Connected.')
+        async with self._server:
+            await self._server.serve_forever()
 
-            self.on_connection(conn, addr)
+    async def _on_connection(self, reader, writer):
+        '''
+        Create the client, wait for its messages.
+        '''
+        addr = writer.get_extra_info('peername')
+
+        Console.print(f'[TCP] |{addr[0]}| Connected.')
+
+        client = self.on_connection(reader, writer, addr)
+        await client.run()
 
     @staticmethod
-    def on_connection(conn, addr):
+    def on_connection(reader, writer, addr):
         '''
         Function executed on new connection.  
-        Has as arguments, conn & addr of the connection.  
+        Has as arguments, the stream reader & writer and the address of the connection.  
+        Return the ClientTCP object.  
         To be implemented.  
         '''
         raise NotImplementedError("on_connection method must be implemented.")
@@ -98,9 +174,11 @@ class ServerTCP:
 class ClientTCP:
     '''
     ClientTCP manage the sending and receiving of the message of a client. It works with the ServerTCP object.  
+    The messages are sent by a separated task (write queue),
+    `send` doesn't block.
 
     Arguments:
-        - conn : the Connection object
+        - reader, writer : the asyncio streams of the connection
         - addr : the address, (ip, port)
     
     Methods:
@@ -110,9 +188,10 @@ class ClientTCP:
         - on_disconnect : Method executed when the client disconnect from the server, to be implemented.
     '''
 
-    def __init__(self, conn, addr):
+    def __init__(self, reader, writer, addr):
         
-        self.conn = conn
+        self.reader = reader
+        self.writer = writer
         
         self.addr = tuple(addr)
         self.ip = addr[0]
@@ -121,39 +200,48 @@ class ClientTCP:
         self.connected = True
         self.call_id = self.ip # used for error/warning
 
-        # number of msg with blank string received,
-        # after 5 of them, close connection with client
-        self._blank_threshold = 5
-        self._n_blank = 0
+        # messages waiting to be sent
+        self._write_queue = asyncio.Queue()
+        self._write_size = 0
 
-    def run(self):
+    async def run(self):
         '''
         Loop that wait for message from client.  
         Execute on_message method.  
-        To end execution, set connected attribute to False.  
+        Stop when the client disconnects.  
         '''
+        write_task = asyncio.create_task(self._write_loop())
 
         while self.connected:
 
-            msg = self.receive()
+            msg_type, msg = await self.receive()
 
-            if msg == None: # there was an error in .receive
-                continue
+            if msg == None: # connection closed
+                if self.connected:
+                    self._disconnect()
+                    self.on_disconnect()
+                    ErrorServer.call("Connection closed.", self.call_id, warning=True)
+                break
 
-            if msg == Spec.DISCONNECT_MSG:
+            if msg_type == Spec.TEXT and msg == Spec.DISCONNECT_MSG:
                 self._disconnect()
                 self.on_disconnect()
                 
-            else:
+            elif msg_type == Spec.PICKLE:
                 self.on_message(msg)
+            
+            else:
+                ErrorServer.call("Unknown message type.", self.call_id, warning=True)
+
+        write_task.cancel()
     
     def _disconnect(self):
         '''
         Internal disconnect method.  
         Close connection and update connected attr
         '''
-        self.conn.close()
         self.connected = False
+        self.writer.close()
 
     @staticmethod
     def on_disconnect():
@@ -172,50 +260,70 @@ class ClientTCP:
         '''
         raise NotImplementedError("on_message method must be implemented.")
 
-    def receive(self):
+    async def receive(self):
         '''
         Wait until receiving a message on own connection.  
-        Message with header, in case of error: abort operation.
+        Message with header, return the type of message and the message,
+        (None, None) if the connection is closed.
         '''
         try:
-            msg_length = self.conn.recv(Spec.HEADER).decode(Spec.FORMAT)
-        except:
-            ErrorServer.call("Failure receiving header.", self.call_id)
-            return
-        
-        if msg_length == '':
-            # safety test -> close connection when client left without disconn msg
-            self._n_blank += 1
-            if self._n_blank == self._blank_threshold:
-                self._disconnect()
-                self.on_disconnect()
-                ErrorServer.call("Connection closed.", self.call_id, warning=True)
-            return
+            header = await self.reader.readexactly(Spec.HEADER.size)
+            length, msg_type = Spec.HEADER.unpack(header)
+
+            if length > Spec.MAX_MSG_SIZE:
+                ErrorServer.call("Message too large.", self.call_id)
+                return None, None
+
+            return msg_type, await self.reader.readexactly(length)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None, None
+
+    async def _write_loop(self):
+        '''
+        Send the messages of the write queue,
+        wait when the connection's buffer is full (backpressure).
+        '''
+        while True:
+            # coalesce the waiting messages in a single write
+            data = [await self._write_queue.get()]
+
+            while not self._write_queue.empty():
+                data.append(self._write_queue.get_nowait())
+            
+            data = b''.join(data)
+            self._write_size -= len(data)
+
+            try:
+                self.writer.write(data)
+                await self.writer.drain()
+            except ConnectionError:
+                ErrorServer.call("Failure sending message.", self.call_id)
+                return
 
-        try:
-            msg_length = int(msg_length)
-            msg = self.conn.recv(msg_length)
-            return msg
-        except:
-            ErrorServer.call("Failure receiving message.", self.call_id)
-        
     def send(self, msg, pickling=False):
         '''
         Send the given message to the client.  
         If pickling=True, pickle the message.  
         In case of error: abort operation.  
         '''
+        if not self.connected:
+            return
+
         if pickling:
             message = pickle.dumps(msg)
+            msg_type = Spec.PICKLE
         else:
             message = msg.encode(Spec.FORMAT)
+            msg_type = Spec.TEXT
         
-        length = len(message)
-        msg_length = str(length).encode(Spec.FORMAT)
-        msg_length += b' ' * (Spec.HEADER - len(msg_length))
+        data = Spec.HEADER.pack(len(message), msg_type) + message
+
+        if self._write_size + len(data) > Spec.MAX_WRITE_BUFFER:
+            ErrorServer.call("Client too slow, connection closed.", self.call_id, warning=True)
+            self._disconnect()
+            self.on_disconnect()
+            return
         
-        try:
-            self.conn.send(msg_length)
-            self.conn.send(message)
-        except:
-            ErrorServer.call("Failure sending message: " + msg, self.call_id)
\ No newline at end of file
+        self._write_size += len(data)
+        self._write_queue.put_nowait(data)
@@ -1,7 +1,5 @@
-import socket, threading
+import asyncio, ctypes, socket, struct
 from lib.console import Console
-from time import time, sleep
-from spec import Spec
 
 class ErrorServer:
 
@@ -15,120 +13,114 @@ class ErrorServer:
         
         Console.print('[UDP]', call_type, traceback)
 
-class Spec:
-    BUFSIZE = 4096
+# linux socket option, select the socket of a SO_REUSEPORT group using a bpf program
+SO_ATTACH_REUSEPORT_CBPF = 51
+
+def create_reuseport_sockets(port, n, offset, ip=None):
+    '''
+    Create `n` udp sockets bound to the same port (SO_REUSEPORT),
+    each datagram is received by the socket of index:
+    the byte at `offset` in the datagram modulo `n`.  
+    If not supported, return a single socket.
+    '''
+    if ip is None:
+        ip = '0.0.0.0'
+
+    sockets = []
+
+    try:
+        for i in range(n):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sockets.append(sock)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((ip, port))
+
+        # classic bpf program: A = byte at offset; A %= n; return A
+        program = struct.pack('<HBBI', 0x30, 0, 0, offset) \
+                + struct.pack('<HBBI', 0x94, 0, 0, n) \
+                + struct.pack('<HBBI', 0x16, 0, 0, 0)
+
+        # keep a reference on the buffer until the option is set
+        buffer = ctypes.create_string_buffer(program)
+        fprog = struct.pack('HP', len(program) // 8, ctypes.addressof(buffer))
+        sockets[0].setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, fprog)
+
+    except (OSError, AttributeError):
+        for sock in sockets:
+            sock.close()
+        
+        if n > 1:
+            ErrorServer.call("SO_REUSEPORT not supported, use a single socket.", warning=True)
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((ip, port))
+        return [sock]
 
-class ServerUDP:
+    return sockets
 
-    def __init__(self, port, ip=None):
+class ServerUDP(asyncio.DatagramProtocol):
+    '''
+    UDP server, run in an asyncio event loop.  
+    The datagrams are given to the `on_message` method (to be implemented),
+    the server must be started in the loop using the `start` coroutine.  
+    If `sock` is given, use the (already bound) socket.
+    '''
 
-        # create socket with UDP protocol
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.bind(port, ip)
+    def __init__(self, port, ip=None, sock=None):
 
         self.port = port
         self.ip = ip
-        self.running = True
-
-        # list all unknown ip
-        self._unknown_ips = []
+        self.sock = sock
+        self.transport = None
 
-        # dict of the clients, key : ip address
-        self._clients = {}
-
-    def bind(self, port, ip=None):
+    async def start(self):
         '''
         Bind the server to the given port & potential ip address.  
         In case of error: abort operation.
         '''
+        if self.ip is None:
+            ip = '0.0.0.0'
+        else:
+            ip = self.ip
 
-        if ip == None:
-            ip = ''
+        loop = asyncio.get_running_loop()
 
-        addr = (ip, port)
+        if not self.sock is None:
+            await loop.create_datagram_endpoint(lambda: self, sock=self.sock)
+            return
 
         try:
-            self.socket.bind(addr)
-        except:
+            await loop.create_datagram_endpoint(lambda: self, local_addr=(ip, self.port))
+        except OSError:
             ErrorServer.call("Port already used.")
             quit()
-    
-    def add_client(self, client):
-        '''
-        Add a client to the server.  
-        '''
-        client.server = self
-        self._clients[client.ip] = client
-
-        # check if client in unknown ips -> remove it
-        if client.ip in self._unknown_ips:
-            self._unknown_ips.remove(client.ip)
 
-    def get_client(self, ip):
+    def stop(self):
         '''
-        Return the client with the specified ip address.  
-        If no client found: return None
+        Close the socket.
         '''
-        if ip in self._clients.keys():
-            return self._clients[ip]
-        
-        return None
+        if not self.transport is None:
+            self.transport.close()
 
-    def remove_client(self, ip):
-        '''
-        Remove the client with the specified ip.
-        '''
-        if ip in self._clients.keys():
-            self._clients.pop(ip)
-
-    def run(self):
-        '''
-        Loop that wait for all messages.  
-        Execute on_connection, clients' on_message method.  
-        To end execution, set running attribute to False.
-        '''
-
-        while self.running:
-
-            # receive msg
-            msg, address = self.socket.recvfrom(Spec.BUFSIZE)
-
-            ip = address[0]
-            
-            if ip in self._clients.keys():
-                client = self._clients[ip]
-                client.on_message(msg)
-
-            else:
-                if not ip in self._unknown_ips:
-                    self._unknown_ips.append(ip)
-                    ErrorServer.call("Unknown IP address: " + ip, warning=True)
+    def connection_made(self, transport):
+        self.transport = transport
 
+    def datagram_received(self, data, addr):
+        self.on_message(data, addr)
 
-class ClientUDP:
+    def error_received(self, exc):
+        ErrorServer.call(str(exc), warning=True)
 
-    server = None
-
-    def __init__(self, addr):
-        
-        self.ip = addr[0]
-        self.port = addr[1]
-        self.addr = tuple(addr)
-
-    @staticmethod
-    def on_message(msg):
+    def on_message(self, msg: bytes, addr):
         '''
         Function executed when receiving a message.  
-        Has as argument, the message.  
+        Has as argument, the message and the address of the sender.  
         To be implemented.  
         '''
         raise NotImplementedError("on_message method must be implemented.")
 
-    def send(self, msg: bytes):
+    def send(self, msg: bytes, addr):
         '''
-        Send the given message to the client.  
-        In case of error: abort operation.  
+        Send the given message to the address (non blocking).
         '''
-        msg += b' ' * (Spec.BUFSIZE - len(msg))
-
-        self.server.socket.sendto(msg, self.addr)
+        self.transport.sendto(msg, addr)
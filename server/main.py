@@ -5,21 +5,29 @@ from udp.server import Server as UDPServer
 from db.db import DataBase
 from spec import Spec
 
-queue = Queue()
+# one udp relay (and queue) per shard
+sockets = UDPServer.create_sockets(Spec.UDP_N_SHARDS)
+queues = [Queue() for sock in sockets]
 
-server_udp = UDPServer()
-server_tcp = TCPServer(queue)
+servers_udp = [UDPServer(shard, sock) for shard, sock in enumerate(sockets)]
+server_tcp = TCPServer(queues)
 
-DataBase.load()
+processes = []
 
-p = Process(target=server_udp.run, args=[queue])
-p.start()
+for server_udp, queue in zip(servers_udp, queues):
+    p = Process(target=server_udp.run, args=[queue])
+    p.start()
+    processes.append(p)
 
+# after the creation of the processes -> the connection & flusher thread stay in this one
+DataBase.load()
 
 try:
     server_tcp.run()
 
 except KeyboardInterrupt:
-    print('\nStore database...\n')
+    print('\nClose database...\n')
     DataBase.store()
-    p.terminate()
\ No newline at end of file
+
+    for p in processes:
+        p.terminate()
\ No newline at end of file
@@ -5,6 +5,36 @@ class Spec:
 
     PORT = 5050
 
+    # in game messages (UDP): version, type, length of the payload,
+    # session token, sequence number
+    UDP_WIRE_VERSION = 2
+    UDP_HEADER_FORMAT = '<BBHII'
+
+    # number of relay processes, each game is handled by one of them (shard),
+    # given by the first byte of the token (modulo the number of shards)
+    UDP_N_SHARDS = 4
+    UDP_SHARD_OFFSET = 4
+
+    # period of the measure of the event loop's delay (sec)
+    UDP_LAG_PERIOD = 0.1
+    # period of the relay statistics report (sec)
+    UDP_REPORT_PERIOD = 60
+    # invalid messages: maximum number of remembered senders (warned once),
+    # time before warning again about a sender (sec)
+    UDP_MAX_UNKNOWN_ADDRS = 1024
+    UDP_UNKNOWN_ADDR_TTL = 60
+
+    ### DB ###
+
+    # sqlite database, in db/data
+    DB_FILENAME = 'users.db'
+    # maximum number of users loaded at the same time
+    DB_CACHE_SIZE = 1000
+    # period of the writing of the modified users (sec)
+    DB_FLUSH_PERIOD = 1
+    # maximum number of users sent around a user / at the top of the leaderboard
+    LEADERBOARD_MAX_USERS = 50
+
     ### MSG ###
 
     SHIP_GRID_SHAPE = (6,6)
\ No newline at end of file
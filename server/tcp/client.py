@@ -1,16 +1,17 @@
 import numpy as np
 import pickle
-from lib.tcp import ClientTCP, Message
+from lib.tcp import ClientTCP, Message, pack_script, unpack_script, get_script_hash, get_grid_hash
 from lib.console import Console
 from tcp.interaction import Interaction
 from db.db import DataBase
+from db.leaderboard import Leaderboard
 from spec import Spec
 
 class Client(ClientTCP):
 
-    def __init__(self, conn, addr):
+    def __init__(self, reader, writer, addr):
 
-        super().__init__(conn, addr)
+        super().__init__(reader, writer, addr)
 
         self.logged = False
         self.username = None
@@ -19,8 +20,13 @@ class Client(ClientTCP):
         # unique tag to identify the game in Interaction
         self.game_tag = None
 
-        # store the script lines temporarely
-        self._script_cache = []
+        # udp address (port given by the user), session token (in game)
+        self.udp_addr = (self.ip, None)
+        self.udp_token = None
+
+        # hash of the script and ship grid that the user has (not sent again)
+        self._script_hash = None
+        self._ship_hash = None
 
         # store the identifiers of the comm as key
         # the values are the methods called for each of the identifier
@@ -36,7 +42,8 @@ class Client(ClientTCP):
             'dg': self.demand_game,
             'rdg': self.response_demand_game,
             'shcf': self.ship_config,
-            'scl': self.on_script_line,
+            'igsh': self.send_opp_ship,
+            'sch': self.set_script_hash,
             'sc': self.save_script,
             'scst': self.set_script_status,
             'sca': self.script_analysis,
@@ -44,7 +51,8 @@ class Client(ClientTCP):
             'egst': self.end_game,
             'gis': self.on_game_init_state,
             'ige': self.in_game_error,
-            'pd': self.profil_demand
+            'pd': self.profil_demand,
+            'lb': self.leaderboard_demand
         }
 
     def on_disconnect(self, content=None):
@@ -74,10 +82,9 @@ class Client(ClientTCP):
 
     def connect_udp(self, content):
         '''
-        Set udp client in udp socket
+        Store the udp address of the client (port given by the client)
         '''
-        address = (self.ip, content)
-        Interaction.connect_udp(address)
+        self.udp_addr = (self.ip, content)
 
     def on_message(self, msg):
         '''
@@ -122,9 +129,7 @@ class Client(ClientTCP):
         self._send_ship()
 
         # script
-        script = DataBase.get_script(self.username)
-        self._send_script(script)
-        self.send(Message('sc', None), pickling=True)
+        self._send_script()
 
         # script status
         script_status = DataBase.get_script_status(self.username)
@@ -162,38 +167,67 @@ class Client(ClientTCP):
         '''
         # ship grid
         arr = DataBase.get_ship(self.username)
+        self._ship_hash = get_grid_hash(arr)
         self.send(Message('sh', arr), pickling=True)
 
         # ship status
         self.send(Message('shst', DataBase.get_ship_status(self.username)), pickling=True)
 
-    def _send_script(self, script: list):
+    def _get_script(self):
+        '''
+        Return the stored script of the user (`str`)
+        '''
+        return '\n'.join(DataBase.get_script(self.username))
+
+    def _send_script(self):
         '''
-        Send the script by little chunk to the client
+        Send the stored script in a single (compressed) message,
+        only send its hash if the user already has it.
         '''
-        for line in script:
-            self.send(Message('scl', line), pickling=True)
+        content = pack_script(self._get_script(), known_hash=self._script_hash)
+        self._script_hash = content[0]
+
+        self.send(Message('sc', content), pickling=True)
 
-    def send_enter_game(self, opp_client, team):
+    def send_enter_game(self, opp_client, team, seed):
         '''
         Send to client that he's entering in a game.  
-        team specify the starting position of the ship.
+        team specify the starting position of the ship,
+        seed is the seed of the game's random generator (same for both users).
         '''
         # send script
-        script = DataBase.get_script(self.username)
-        self._send_script(script)
-        self.send(Message('sc', None), pickling=True)
-
-        # send opp ship grid
-        arr = DataBase.get_ship(opp_client.username)
-        self.send(Message('igsh', arr), pickling=True)
+        self._send_script()
 
-        # send own ship grid
+        # send own ship grid, if the user doesn't have it
         arr = DataBase.get_ship(self.username)
-        self.send(Message('sh', arr), pickling=True)
+        grid_hash = get_grid_hash(arr)
+
+        if grid_hash != self._ship_hash:
+            self._ship_hash = grid_hash
+            self.send(Message('sh', arr), pickling=True)
 
-        # notify in game | opponent username, the position id of the ship
-        self.send(Message('ign', [opp_client.username, team]), pickling=True)
+        # notify in game | opponent username, the position id of the ship, udp session token,
+        # seed of the game, hash of the opp ship grid (sent on demand, if the user doesn't have it in cache)
+        opp_hash = get_grid_hash(DataBase.get_ship(opp_client.username))
+        self.send(Message('ign', [opp_client.username, team, self.udp_token, seed, opp_hash]), pickling=True)
+
+    def send_opp_ship(self, grid_hash):
+        '''
+        Send the ship grid of the opponent (not in the user's cache),
+        with its hash.  
+        If it isn't the requested grid (modified since the notification),
+        the current grid is sent, with its own hash.
+        '''
+        if self.opponent is None:
+            return
+        
+        arr = DataBase.get_ship(self.opponent)
+        arr_hash = get_grid_hash(arr)
+
+        if arr_hash != grid_hash:
+            self.print("Requested ship grid doesn't match the opponent's one.", warning=True)
+
+        self.send(Message('igsh', [arr_hash, arr]), pickling=True)
 
     def login(self, content):
         '''
@@ -276,6 +310,25 @@ class Client(ClientTCP):
 
         self.send(msg, pickling=True)
 
+    def leaderboard_demand(self, content):
+        '''
+        Send the rank of a user, the first users of the leaderboard
+        and the users around the user.  
+        Content: username, number of users (top & around)
+        '''
+        username, n = content
+        n = min(max(int(n), 0), Spec.LEADERBOARD_MAX_USERS)
+
+        msg = Message('rlb', {
+            'username': username,
+            'rank': Leaderboard.get_rank(username),
+            'n_users': Leaderboard.get_n_users(),
+            'top': Leaderboard.get_top(n),
+            'around': Leaderboard.get_around(username, n)
+        })
+
+        self.send(msg, pickling=True)
+
     def demand_friend(self, content):
         '''
         Manage the friend demand
@@ -375,25 +428,56 @@ class Client(ClientTCP):
         DataBase.set_ship(self.username, arr)
         DataBase.set_ship_status(self.username, 1)
 
+        self._ship_hash = get_grid_hash(arr)
+
         self.send(Message('shst', 1), pickling=True)
 
-    def save_script(self, status):
+    def _resolve_script(self, content):
+        '''
+        Return the script of a script message,
+        None if it was omitted and isn't the stored one or if it is invalid.
+        '''
+        try:
+            script_hash, script = unpack_script(content)
+        except ValueError as e:
+            self.print(f"Invalid script: {e}", warning=True)
+            return None
+
+        if script is None:
+            script = self._get_script()
+            
+            if get_script_hash(script) != script_hash:
+                self.print("Unknown script hash.", warning=True)
+                return None
+        
+        self._script_hash = script_hash
+        return script
+
+    def set_script_hash(self, script_hash):
+        '''
+        Store the hash of the script that the user has (stored on local).
+        '''
+        self._script_hash = script_hash
+
+    def save_script(self, content):
         '''
         Store the script
         '''
-        script = self._script_cache
-        DataBase.set_script(self.username, script)
+        script = self._resolve_script(content)
 
-        # empty cache
-        self._script_cache = []
+        if not script is None:
+            DataBase.set_script(self.username, script.split('\n'))
 
-    def script_analysis(self, status):
+    def script_analysis(self, content):
         '''
         Analyse the script, look for cheating attempts.  
         Send response to user.
         '''
-        script = '\n'.join(self._script_cache)
-        self._script_cache = []
+        script = self._resolve_script(content)
+
+        if script is None:
+            self.send(Message('rsca', False), pickling=True)
+            return
         
         fine = True        
 
@@ -463,12 +547,6 @@ class Client(ClientTCP):
         '''
         Interaction.set_user_waiting_game(self.username, content)
 
-    def on_script_line(self, line):
-        '''
-        Store the line in the script cache
-        '''
-        self._script_cache.append(line)
-
     def display_msg(self, msg: Message):
         '''
         Display the Message to the terminal
@@ -476,8 +554,8 @@ class Client(ClientTCP):
         '''
         display_content = True
 
-        if msg.identifier == 'scl':
-            return
+        if msg.identifier in ('sc', 'sca'):
+            display_content = False
         elif type(msg.content) is np.ndarray:
             display_content = False
         
@@ -1,4 +1,5 @@
 import numpy as np
+import secrets
 from lib.tcp import Message
 from db.db import DataBase
 from spec import Spec
@@ -9,8 +10,10 @@ class Interaction:
 
     Manage the interaction between the clients.
     '''
-    # queue used to communicate with the udp server
-    queue = None
+    # queues used to communicate with the udp servers (one per shard)
+    queues = []
+    # number of games of each shard
+    shards_loads = []
 
     clients = {}
     waiting_game = []
@@ -18,6 +21,8 @@ class Interaction:
     # for each game: store a dict with {username: status}
     # by default status=None, then it can equal either 'win' or 'loss'
     games = {}
+    # tag of the game of each user, key: username
+    users_games = {}
 
 
     @classmethod
@@ -31,11 +36,26 @@ class Interaction:
     def remove(cls, username):
         '''
         Remove a client from the interaction.  
-        Also remove client from udp server.
+        Also remove client from udp server,
+        if the client is in a game: remove the game.
         '''
         if cls.is_user(username):
 
-            cls.queue.put(['rm', cls.clients[username].ip])
+            tag = cls.users_games.get(username)
+
+            if not tag is None:
+                # store the results already set,
+                # the other ones are stored when the users end the game
+                for user, result in cls.games[tag].items():
+                    if not result is None:
+                        cls.store_result(user, result)
+
+                cls.remove_game(tag)
+
+            token = cls.clients[username].udp_token
+
+            if not token is None:
+                cls.queues[cls.get_shard(token)].put(['rm', token])
 
             cls.clients.pop(username)
 
@@ -55,7 +75,13 @@ class Interaction:
         `int` tag: the unique tag of the game (stored in `.game_tag`)  
         `str` result: either `"win"` or `"loss"`
         '''
-        game = cls.games[tag]
+        game = cls.games.get(tag)
+
+        # the opponent left the game
+        if game is None:
+            cls.store_result(username, result)
+            return
+
         game[username] = result
 
         # check if both users have finished the game
@@ -63,37 +89,64 @@ class Interaction:
             cls.end_game(tag)
 
     @classmethod
-    def connect_udp(cls, address):
+    def create_token(cls, shard):
         '''
-        Add a client on the udp socket
+        Return a random session token of the given shard:
+        its first byte modulo the number of shards is the shard.
         '''
-        cls.queue.put(['conn', address])
+        n = len(cls.queues)
+        low_byte = secrets.randbelow(256 // n) * n + shard
+
+        return (secrets.randbits(24) << 8) | low_byte
+
+    @classmethod
+    def get_shard(cls, token):
+        '''
+        Return the shard of a session token.
+        '''
+        return (token & 0xFF) % len(cls.queues)
 
     @classmethod
     def end_game(cls, tag):
         '''
         End a game, stop udp clients.  
         '''
-        user1, user2 = cls.games[tag].keys()
-
         # update DataBase
-        if cls.games[tag][user1] == 'win':
-            DataBase.increment_wins(user1)
-        else:
-            DataBase.increment_loss(user1)
+        for username, result in cls.games[tag].items():
+            cls.store_result(username, result)
+
+        cls.remove_game(tag)
 
-        if cls.games[tag][user2] == 'win':
-            DataBase.increment_wins(user2)
+    @classmethod
+    def store_result(cls, username, result):
+        '''
+        Update the wins/loss of a user given its result.
+        '''
+        if result == 'win':
+            DataBase.increment_wins(username)
         else:
-            DataBase.increment_loss(user2)
+            DataBase.increment_loss(username)
+
+    @classmethod
+    def remove_game(cls, tag):
+        '''
+        Remove a game, stop udp clients, update the load of the shard.
+        '''
+        user1, user2 = cls.games.pop(tag).keys()
+
+        cls.users_games.pop(user1)
+        cls.users_games.pop(user2)
 
         # update udp clients
-        ip1 = cls.clients[user1].ip
-        ip2 = cls.clients[user2].ip
+        token1 = cls.clients[user1].udp_token
+        token2 = cls.clients[user2].udp_token
+        shard = cls.get_shard(token1)
 
-        cls.queue.put(['unlink', ip1, ip2])
+        cls.queues[shard].put(['unlink', token1, token2])
+        cls.shards_loads[shard] -= 1
 
-        cls.games.pop(tag)
+        cls.clients[user1].udp_token = None
+        cls.clients[user2].udp_token = None
 
     @classmethod
     def send_connection_state(cls, username, state):
@@ -193,14 +246,33 @@ class Interaction:
         cls.clients[user1].game_tag = tag
         cls.clients[user2].game_tag = tag
 
+        cls.users_games[user1] = tag
+        cls.users_games[user2] = tag
+
         cls.clients[user1].opponent = user2
         cls.clients[user2].opponent = user1
 
-        # link client on udp server
-        ip1 = cls.clients[user1].ip
-        ip2 = cls.clients[user2].ip
+        # link client on the udp server with the less games,
+        # each one with a unique token
+        if len(cls.shards_loads) != len(cls.queues):
+            cls.shards_loads = [0 for queue in cls.queues]
+
+        shard = cls.shards_loads.index(min(cls.shards_loads))
+        cls.shards_loads[shard] += 1
+
+        token1 = cls.create_token(shard)
+        token2 = cls.create_token(shard)
 
-        cls.queue.put(['link', ip1, ip2])
+        while token2 == token1:
+            token2 = cls.create_token(shard)
+
+        cls.clients[user1].udp_token = token1
+        cls.clients[user2].udp_token = token2
+
+        cls.queues[shard].put(['link',
+            (cls.clients[user1].udp_addr, token1),
+            (cls.clients[user2].udp_addr, token2),
+        ])
 
         # notify clients on local
 
@@ -208,5 +280,8 @@ class Interaction:
         team1 = np.random.randint(1,3)
         team2 = -team1 + 3
 
-        cls.clients[user1].send_enter_game(cls.clients[user2], team1)
-        cls.clients[user2].send_enter_game(cls.clients[user1], team2)
\ No newline at end of file
+        # random seed of the game's simulation, unknown before the game
+        seed = secrets.randbits(32)
+
+        cls.clients[user1].send_enter_game(cls.clients[user2], team1, seed)
+        cls.clients[user2].send_enter_game(cls.clients[user1], team2, seed)
\ No newline at end of file
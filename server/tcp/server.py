@@ -2,30 +2,25 @@ from lib.tcp import ServerTCP
 from tcp.client import Client
 from tcp.interaction import Interaction
 from spec import Spec
-import threading
 
 class Server(ServerTCP):
 
-    def __init__(self, queue):
+    def __init__(self, queues):
 
         super().__init__(Spec.PORT)
 
-        # queue used to communicate with the udp server
-        self.queue = queue
-        Interaction.queue = queue
+        # queues used to communicate with the udp servers (one per shard)
+        self.queues = queues
+        Interaction.queues = queues
 
         self.clients = {} # key: ip 
-        self.threads = {} # key: ip 
 
-    def on_connection(self, conn, addr):
+    def on_connection(self, reader, writer, addr):
         '''
-        Create client object and run client's loop in separate thread.
+        Create client object, its loop is run in the event loop.
         '''
-        client = Client(conn, addr)
+        client = Client(reader, writer, addr)
         
         self.clients[client.ip] = client
 
-        thread = threading.Thread(target=client.run)
-        self.threads[client.ip] = thread
-
-        thread.start()
+        return client
\ No newline at end of file
@@ -1,18 +1,25 @@
-import numpy as np
-from lib.udp import ClientUDP
-from spec import Spec
+class Client:
+    '''
+    UDP session of a user in a game.  
+    Identified by a token (sent in each message),
+    the address is updated with the one of the received messages.
+    '''
 
-class Client(ClientUDP):
+    def __init__(self, addr, token):
 
-    def __init__(self, addr):
-
-        super().__init__(addr)
+        self.addr = tuple(addr)
+        self.ip = addr[0]
+        self.token = token
 
         self.opp_client = None
 
-    def on_message(self, msg):
+    def set_addr(self, addr):
         '''
-        Send state to other client.
+        Set the address of the session, the ip can't be changed.  
+        Return if the address is valid.
         '''
-        if self.opp_client != None:
-            self.opp_client.send(msg)
\ No newline at end of file
+        if addr[0] != self.ip:
+            return False
+        
+        self.addr = tuple(addr)
+        return True
@@ -1,74 +1,256 @@
-from lib.udp import ServerUDP
+from lib.udp import ServerUDP, ErrorServer, create_reuseport_sockets
 from lib.console import Console
 from udp.client import Client
 from spec import Spec
-import threading
+from collections import OrderedDict
+import asyncio, struct, time
 
 
 class Server(ServerUDP):
+    '''
+    Relay of the in game messages.
+    Each datagram is forwarded as is to the opponent's session (not copied),
+    the sessions are given by the tcp server (through the queue).  
+    The opponent receives the sender's token, it is ignored by the clients
+    and can't be used to take the session from another ip (see `Client.set_addr`).  
+    Several relays (shards) can share the same port (see `create_sockets`),
+    each one handles the games of its shard.
+    '''
+    header = struct.Struct(Spec.UDP_HEADER_FORMAT)
 
-    def __init__(self):
+    def __init__(self, shard=0, sock=None):
 
-        super().__init__(Spec.PORT)
+        super().__init__(Spec.PORT, sock=sock)
 
-    def create_client(self, addr):
+        self.shard = shard
+
+        # sessions, key: token
+        self._clients = {}
+        # key: address
+        self._addresses = {}
+
+        # addresses that sent an invalid message (warned once),
+        # key: address, value: time of the warning (oldest first)
+        self._unknown_addrs = OrderedDict()
+
+        # relay statistics since the last report
+        self._n_msg = 0
+        self._total_latency = 0
+        self._max_latency = 0
+        self._max_lag = 0
+
+    @staticmethod
+    def create_sockets(n_shards):
         '''
-        Create a client given it's address
+        Create the sockets of the relays,
+        the datagrams are given to the socket of their shard.  
+        Return a list of sockets (a single one if not supported).
+        '''
+        return create_reuseport_sockets(Spec.PORT, n_shards, Spec.UDP_SHARD_OFFSET)
+
+    def create_client(self, addr, token):
+        '''
+        Create a session given the address of the user
+        (its ip & the port given on the tcp connection) and its token.
         '''
         Console.print(f"[UDP] |{addr[0]}| Connected.")
-        client = Client(addr)
-        self.add_client(client)
+        client = Client(addr, token)
+        self._clients[token] = client
+        self._addresses[client.addr] = client
+        return client
 
-    def link_clients(self, ip1, ip2):
+    def remove_client(self, token):
         '''
-        Link two clients together.
+        Remove the session with the specified token.
         '''
-        self.get_client(ip1).opp_client = self.get_client(ip2)
-        self.get_client(ip2).opp_client = self.get_client(ip1)
+        client = self._clients.pop(token, None)
+
+        if client is None:
+            return
 
-    def unlink_clients(self, ip1, ip2):
+        if self._addresses.get(client.addr) is client:
+            self._addresses.pop(client.addr)
+
+        if not client.opp_client is None:
+            client.opp_client.opp_client = None
+
+    def link_clients(self, session1, session2):
         '''
-        Unlink two clients
+        Create the sessions of two users, link them together.
+        `session`: (address, token)
         '''
-        self.get_client(ip1).opp_client = None
-        self.get_client(ip2).opp_client = None
+        client1 = self.create_client(*session1)
+        client2 = self.create_client(*session2)
 
-    def run(self, queue):
+        client1.opp_client = client2
+        client2.opp_client = client1
+
+    def unlink_clients(self, token1, token2):
         '''
-        Run the server's run method in a separated thread,  
-        start a inf loop that wait for comm through the queue
+        Remove the sessions of two users.
         '''
+        self.remove_client(token1)
+        self.remove_client(token2)
 
-        self.main_thread = threading.Thread(target=super().run)
+    def _get_client(self, msg, addr):
+        '''
+        Return the session of the sender of the message,
+        None if the message is invalid.
+        '''
+        if len(msg) < self.header.size:
+            return None
 
-        self.main_thread.start()
+        version, _, length, token, _ = self.header.unpack_from(msg)
 
-        while True:
+        if version != Spec.UDP_WIRE_VERSION or len(msg) != self.header.size + length:
+            return None
 
-            msg = queue.get()
+        client = self._addresses.get(addr)
 
-            if msg == "stop":
-                self.running = False
+        if not client is None and client.token == token:
+            return client
+
+        # the address can be different from the given one (NAT)
+        client = self._clients.get(token)
+
+        if client is None:
+            return None
+        
+        old_addr = client.addr
+
+        if not client.set_addr(addr):
+            return None
+
+        if self._addresses.get(old_addr) is client:
+            self._addresses.pop(old_addr)
+
+        self._addresses[client.addr] = client
+        return client
+
+    def _warn_unknown(self, addr):
+        '''
+        Warn about an invalid message,
+        once per address & `Spec.UDP_UNKNOWN_ADDR_TTL`.  
+        At most `Spec.UDP_MAX_UNKNOWN_ADDRS` addresses are remembered.
+        '''
+        now = time.monotonic()
+
+        # forget the expired addresses
+        while len(self._unknown_addrs) > 0:
+            old_addr, warn_time = next(iter(self._unknown_addrs.items()))
+
+            if now - warn_time < Spec.UDP_UNKNOWN_ADDR_TTL and \
+                len(self._unknown_addrs) < Spec.UDP_MAX_UNKNOWN_ADDRS:
                 break
 
-            # connect new client
-            if msg[0] == 'conn':
-                self.create_client(msg[1])
+            self._unknown_addrs.pop(old_addr)
+        
+        if addr in self._unknown_addrs:
+            return
+
+        self._unknown_addrs[addr] = now
+        ErrorServer.call(f"Invalid message from: {addr[0]}:{addr[1]}", warning=True)
+
+    def on_message(self, msg, addr):
+        '''
+        Forward the message to the opponent.
+        '''
+        start = time.perf_counter()
+
+        client = self._get_client(msg, addr)
+
+        if client is None:
+            self._warn_unknown(addr)
+            return
+
+        # the opponent's port is unknown until it sends a message
+        if client.opp_client is None or client.opp_client.addr[1] is None:
+            return
+
+        self.send(msg, client.opp_client.addr)
 
-            # link two users to each other -> in game comm
-            if msg[0] == 'link':
-                ip1, ip2 = msg[1:]
+        latency = time.perf_counter() - start
+        self._n_msg += 1
+        self._total_latency += latency
+        self._max_latency = max(self._max_latency, latency)
 
-                self.link_clients(ip1, ip2)
-            
-            # break connection beteween two users
-            elif msg[0] == 'unlink':
-                ip1, ip2 = msg[1:]
+    async def _monitor(self):
+        '''
+        Measure the delay of the event loop,
+        periodically report the relay statistics.
+        '''
+        loop = asyncio.get_running_loop()
+        last_report = loop.time()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(Spec.UDP_LAG_PERIOD)
+            lag = loop.time() - start - Spec.UDP_LAG_PERIOD
+            self._max_lag = max(self._max_lag, lag)
+
+            if loop.time() - last_report < Spec.UDP_REPORT_PERIOD:
+                continue
+
+            last_report = loop.time()
+
+            if self._n_msg > 0:
+                Console.print(
+                    f"[UDP] shard {self.shard}: {len(self._clients)} sessions | "
+                    f"{self._n_msg / Spec.UDP_REPORT_PERIOD:.0f} msg/s | "
+                    f"relay latency: mean {1e6 * self._total_latency / self._n_msg:.0f}us "
+                    f"max {1e6 * self._max_latency:.0f}us | "
+                    f"loop lag: max {1e3 * self._max_lag:.1f}ms"
+                )
+
+            self._n_msg = 0
+            self._total_latency = 0
+            self._max_latency = 0
+            self._max_lag = 0
+
+    def on_command(self, msg):
+        '''
+        Execute a command of the tcp server.
+        Return False if the server must stop.
+        '''
+        if msg == "stop":
+            return False
 
-                self.unlink_clients(ip1, ip2)
+        # link two users to each other -> in game comm
+        if msg[0] == 'link':
+            self.link_clients(*msg[1:])
 
-            # remove a client -> disconnection
-            elif msg[0] == 'rm':
-                self.remove_client(msg[1])
+        # break connection beteween two users
+        elif msg[0] == 'unlink':
+            self.unlink_clients(*msg[1:])
 
-            
\ No newline at end of file
+        # remove a session -> disconnection
+        elif msg[0] == 'rm':
+            self.remove_client(msg[1])
+
+        return True
+
+    async def _run(self, queue):
+        '''
+        Start the server, wait for the commands of the tcp server.
+        '''
+        await self.start()
+
+        loop = asyncio.get_running_loop()
+        monitor = loop.create_task(self._monitor())
+
+        while True:
+            # the queue is blocking -> wait in another thread
+            msg = await loop.run_in_executor(None, queue.get)
+
+            if not self.on_command(msg):
+                break
+
+        monitor.cancel()
+        self.stop()
+
+    def run(self, queue):
+        '''
+        Run the server in an asyncio event loop,
+        the commands of the tcp server are received through the queue.
+        '''
+        asyncio.run(self._run(queue))